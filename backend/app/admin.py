@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify, redirect, session, url_for
+from flask import Blueprint, request, jsonify, redirect, session, url_for, Response, stream_with_context
 import hashlib
 import requests
 import datetime
@@ -14,10 +14,26 @@ from database import feedback_collection
 from database import questions_collection
 from database import issues_collection
 from pipeline import issue_close_mail  # Import the email function
+import pipeline
+import mailer
+import jobs
+import classifier
+import resultcache
+from cache import TTLCache
+import exports
+import search
+import dashboard
+import rollups
+import metrics
+import questions
+import lendstore
+import memory
+import io
 
 # Flask Blueprint
 admin_bp = Blueprint("admin", __name__)
-CORS(admin_bp)
+CORS(admin_bp, expose_headers=["X-Total-Count", "X-Next-Cursor"])
+metrics.instrument(admin_bp)
 
 session = {}
 
@@ -74,25 +90,9 @@ def check_session():
 def feedback_count():
     days = int(request.args.get("days", 5))
     now = datetime.datetime.utcnow()
-    start_date = now - datetime.timedelta(days=days)
-
-    # Get feedback count for the last 5 days
-    feedback_counts = feedback_collection.aggregate([
-        {"$match": {"date": {"$gte": start_date}}},
-        {
-            "$group": {
-                "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}},
-                "feedback_count": {"$sum": 1}
-            }
-        },
-        {"$sort": {"_id": 1}}  # Sort by date
-    ])
-
-    # Prepare the response
-    response = {str((now - datetime.timedelta(days=i)).date()): 0 for i in range(days)}  # Initialize counts for the last 5 days
-    for count in feedback_counts:
-        response[count["_id"]] = count["feedback_count"]
 
+    # Get feedback count per day from the daily rollups
+    response, _ = rollups.daily_counts("feedback_count", now, days)
     return jsonify(response), 200
 
 
@@ -100,27 +100,23 @@ def feedback_count():
 def login_count():
     days = int(request.args.get("days", 5))
     now = datetime.datetime.utcnow()
-    start_date = now - datetime.timedelta(days=days)
 
-    # Get login count for the specified number of days
-    login_counts = user_logs_collection.aggregate([
-        {"$match": {"date": {"$gte": start_date}}},
-        {
-            "$group": {
-                "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}},
-                "login_count": {"$sum": 1}
-            }
-        },
-        {"$sort": {"_id": 1}}  # Sort by date
-    ])
+    # Get login count per day from the daily rollups
+    response, _ = rollups.daily_counts("login_count", now, days)
+    return jsonify(response), 200
 
-    # Prepare the response
-    response = {str((now - datetime.timedelta(days=i)).date()): 0 for i in range(days)}  # Initialize counts for the last 'days' days
-    for count in login_counts:
-        response[count["_id"]] = count["login_count"]
 
-    print(response)  # Debug print to see the response structure
-    return jsonify(response), 200
+# route to get every dashboard figure (counts, rates, issue summary, time taken) in one round trip
+@admin_bp.route("/dashboard", methods=["GET"])
+def get_dashboard():
+    try:
+        days = int(request.args.get("days", 5))
+    except ValueError:
+        days = 0
+    if days < 1 or days > 366:
+        return jsonify({"error": "days must be between 1 and 366."}), 400
+
+    return jsonify(dashboard.get_dashboard(days)), 200
 
 
 # route to calculate and get feedback rate for past n days
@@ -130,10 +126,9 @@ def login_count():
 @admin_bp.route("/feedback_rate/<int:days>", methods=["GET"])
 def feedback_rate(days):
     now = datetime.datetime.utcnow()
-    start_date = now - datetime.timedelta(days=days)
 
     # Calculate feedback rate
-    total_feedback = feedback_collection.count_documents({"date": {"$gte": start_date}})
+    _, total_feedback = rollups.daily_counts("feedback_count", now, days)
     feedback_rate = total_feedback / days if days > 0 else 0
 
     return jsonify({"rate": feedback_rate}), 200
@@ -141,10 +136,9 @@ def feedback_rate(days):
 @admin_bp.route("/login_rate/<int:days>", methods=["GET"])
 def login_rate(days):
     now = datetime.datetime.utcnow()
-    start_date = now - datetime.timedelta(days=days)
 
     # Calculate login rate
-    total_logins = user_logs_collection.count_documents({"date": {"$gte": start_date}})
+    _, total_logins = rollups.daily_counts("login_count", now, days)
     login_rate = total_logins / days if days > 0 else 0
 
     return jsonify({"rate": login_rate}), 200
@@ -154,19 +148,8 @@ def login_rate(days):
 
 @admin_bp.route("/get_feedback_questions", methods=["GET"])
 def get_feedback_questions():
-    questions = questions_collection.find({}, {"_id": 1, "question": 1, "options": 1})
-    feedback_questions = []
-    for question in questions:
-        if "question" in question and "options" in question:
-            feedback_questions.append({
-                "id": str(question["_id"]),
-                "question": question["question"],
-                "options": question["options"]
-            })
-        else:
-            print(f"Missing keys in question document: {question}")
-
-    return jsonify(feedback_questions), 200
+    # served from the per-process question cache, 304 when the browser's copy is current
+    return questions.questions_response(request, private=True)
 
 @admin_bp.route("/add_feedback_questions", methods=["POST"])
 def add_feedback_questions():
@@ -186,6 +169,7 @@ def add_feedback_questions():
         "question": question,
         "options": options
     })
+    questions.invalidate()
 
     return jsonify({"message": "Feedback question added successfully."}), 201
 
@@ -200,6 +184,7 @@ def delete_feedback_question(question_id):
 
     if result.deleted_count == 0:
         return jsonify({"error": "Question not found."}), 404
+    questions.invalidate()
 
     return jsonify({"message": "Feedback question deleted successfully."}), 200
 
@@ -267,33 +252,73 @@ def delete_admin(username):
     return jsonify({"message": "Admin deleted successfully."}), 200
 
 
+FEEDBACK_PAGE_SIZE = int(os.getenv("FEEDBACK_PAGE_SIZE", 50))
+MAX_FEEDBACK_PAGE_SIZE = 500
+FEEDBACK_FIELDS = ("email", "roll_no", "feedback_answers", "feedback_time_taken", "floor_no", "date", "issue_presence")
+
+# short lived cache for collection totals shown next to paginated lists
+count_cache = TTLCache(ttl=60)
+
+
+def encode_page_cursor(document):
+    return f"{document['date'].isoformat()}_{document['_id']}"
+
+
+def decode_page_cursor(cursor):
+    date, _, object_id = cursor.rpartition("_")
+    return datetime.datetime.fromisoformat(date), ObjectId(object_id)
+
+
 @admin_bp.route("/get_feedback_submissions", methods=["GET"])
 def get_feedback_submissions():
-    # Route to fetch feedback submission from database and send to admin submissions page
-    feedbacks = feedback_collection.find({}, {
-        "_id": 0,  # Exclude the MongoDB ID from the response
-        "email":1,
-        "roll_no": 1,
-        "feedback_answers": 1,
-        "feedback_time_taken":1,
-        "floor_no": 1,
-        "date":1,
-        "issue_presence":1
-    })
-    
+    # Route to fetch feedback submission from database and send to admin submissions page.
+    # Pages are ordered newest first and keyed on (date, _id): pass the X-Next-Cursor
+    # header of one page as ?cursor= to get the next one.
+    try:
+        limit = min(int(request.args.get("limit", FEEDBACK_PAGE_SIZE)), MAX_FEEDBACK_PAGE_SIZE)
+        cursor = request.args.get("cursor")
+        filters = {}
+        if cursor:
+            last_date, last_id = decode_page_cursor(cursor)
+            filters = {"$or": [
+                {"date": {"$lt": last_date}},
+                {"date": last_date, "_id": {"$lt": last_id}}
+            ]}
+    except Exception:
+        return jsonify({"error": "Invalid limit or cursor."}), 400
+    if limit < 1:
+        return jsonify({"error": "Invalid limit or cursor."}), 400
+
+    fields = FEEDBACK_FIELDS
+    if request.args.get("fields"):
+        fields = tuple(f.strip() for f in request.args["fields"].split(","))
+        if not set(fields) <= set(FEEDBACK_FIELDS):
+            return jsonify({"error": f"Fields must be among {', '.join(FEEDBACK_FIELDS)}."}), 400
+
+    projection = {field: 1 for field in fields}
+    projection.update({"_id": 1, "date": 1})  # needed for the page cursor
+    # one row more than the page: it only tells whether there is a next page
+    feedbacks = list(feedback_collection.find(filters, projection)
+                     .sort([("date", -1), ("_id", -1)])
+                     .limit(limit + 1))
+    has_more = len(feedbacks) > limit
+    feedbacks = feedbacks[:limit]
+
     feedback_list = []
     for feedback in feedbacks:
-        feedback_list.append({
-            "email": feedback.get("email"),
-            "roll_no": feedback.get("roll_no").upper(),
-            "feedback_answers": feedback.get("feedback_answers"),
-            "floor_no": feedback.get("floor_no"),
-            "feedback_time_taken":feedback.get("feedback_time_taken"),
-            "date": feedback.get("date"),
-            "issue_presence":str(feedback.get("issue_presence"))
-        })
+        entry = {field: feedback.get(field) for field in fields}
+        if "roll_no" in entry and entry["roll_no"]:
+            entry["roll_no"] = entry["roll_no"].upper()
+        if "issue_presence" in entry:
+            entry["issue_presence"] = str(entry["issue_presence"])
+        feedback_list.append(entry)
 
-    return jsonify(feedback_list), 200
+    response = jsonify(feedback_list)
+    response.headers["X-Total-Count"] = str(count_cache.get_or_set(
+        "feedback", feedback_collection.estimated_document_count))
+    if has_more:
+        response.headers["X-Next-Cursor"] = encode_page_cursor(feedbacks[-1])
+    return response, 200
 
 
 # route to search feedback according to the given conditions
@@ -304,22 +329,13 @@ def search_feedback():
     start_date = request.args.get("startDate")  # Get start date
     end_date = request.args.get("endDate")  # Get end date
 
-    # Build the search filter based on the filter type
-    filters = {}
-    if filter_type == "roll_no":
-        filters["roll_no"] = {"$regex": query, "$options": "i"}
-    elif filter_type == "keyword":
-        filters["feedback_answers.answer"] = {"$regex": query, "$options": "i"}
-    else:
-        return jsonify({"error": "Invalid filter type."}), 400
-
-    # Add date filtering if provided
-    if start_date:
-        filters["date"] = {"$gte": start_date}
-    if end_date:
-        filters["date"] = {"$lte": end_date}
+    # Build an index friendly filter (see search.py)
+    try:
+        filters, projection, sort = search.feedback_search(filter_type, query, start_date, end_date)
+    except ValueError:
+        return jsonify({"error": "Invalid filter type or date."}), 400
 
-    feedbacks = feedback_collection.find(filters)
+    feedbacks = feedback_collection.find(filters, projection or None).sort(sort)
 
     feedback_list = []
     for feedback in feedbacks:
@@ -343,7 +359,8 @@ def get_issues():
         "status": 1,
         "resolved_date":1,
         "issue":1,
-        "user_score":1
+        "user_score":1,
+        "votes":1
     })
     
     issue_list = []
@@ -355,7 +372,8 @@ def get_issues():
             "issue_raise_date": issue.get("issue_raise_date"),
             "status": issue.get("status"),
             "resolved_date":issue.get("resolved_date"),
-            "user_score":issue.get("user_score")*100
+            "user_score":issue.get("user_score")*100,
+            "votes": issue.get("votes", 1)
         })
         print(issue)
 
@@ -411,6 +429,8 @@ def resolve_issue(issue_id):
     if result.modified_count == 0:
         return jsonify({"error": "Issue not found or status not changed."}), 404
 
+    dashboard.invalidate()
+
     # Send email notification
     issue_close_mail("RESOLVED", user_email, user_name)
 
@@ -434,6 +454,8 @@ def suspend_issue(issue_id):
     if result.modified_count == 0:
         return jsonify({"error": "Issue not found or status not changed."}), 404
 
+    dashboard.invalidate()
+
     # Send email notification
     issue_close_mail("SUSPENDED", user_email, user_name)
 
@@ -457,6 +479,8 @@ def set_pending_issue(issue_id):
     if result.modified_count == 0:
         return jsonify({"error": "Issue not found or status not changed."}), 404
 
+    dashboard.invalidate()
+
     # Send email notification
     issue_close_mail("PENDING", user_email, user_name)
 
@@ -468,20 +492,11 @@ def filter_issues():
     status = request.args.get("status")
     category = request.args.get("category")
     query = request.args.get("query", "")
+    filter_type = request.args.get("filter", "user")  # "user" prefix or "keyword" in the issue text
 
-    filters = {}
-    if status:
-        filters["status"] = status
-    if category:
-        filters["category"] = category
-
-    if query:
-        filters["$or"] = [
-            {"raised_by": {"$regex": query, "$options": "i"}},
-            {"roll_no": {"$regex": query, "$options": "i"}}
-        ]
+    filters, projection, sort = search.issue_search(status, category, query, filter_type)
 
-    issues = issues_collection.find(filters)
+    issues = issues_collection.find(filters, projection or None).sort(sort)
     issue_list = []
     for issue in issues:
         issue_list.append({
@@ -491,7 +506,8 @@ def filter_issues():
             "issue_raise_date": issue.get("issue_raise_date"),
             "status": issue.get("status"),
             "resolved_date": issue.get("resolved_date"),
-            "category": issue.get("category")  # Assuming category is stored in the issue document
+            "category": issue.get("category"),  # Assuming category is stored in the issue document
+            "votes": issue.get("votes", 1)
         })
 
     return jsonify(issue_list), 200
@@ -505,6 +521,142 @@ def feedback_time_taken():
     return jsonify(time_taken_list), 200
 
 
+# route to swap the sentiment model directory without restarting the server
+@admin_bp.route("/reload_model", methods=["POST"])
+def reload_model():
+    data = request.json or {}
+    model_path = data.get("model_path")
+    backend = data.get("backend")
+
+    if model_path:
+        # only directories under MODELS_ROOT, never an arbitrary path from the request
+        model_path = classifier.resolve_model_dir(model_path)
+        if model_path is None:
+            return jsonify({"error": "Model directory not found under MODELS_ROOT."}), 400
+    if backend and backend not in classifier.BACKENDS:
+        return jsonify({"error": f"Unknown backend, expected one of {', '.join(classifier.BACKENDS)}."}), 400
+
+    try:
+        loaded_path = classifier.reload_classifier(model_path, backend)
+    except Exception as e:
+        logging.error(f"Model reload failed: {str(e)}")
+        return jsonify({"error": "Model reload failed."}), 500
+
+    return jsonify({
+        "message": "Model reloaded successfully.",
+        "model_path": loaded_path,
+        "backend": classifier.loaded_backend()
+    }), 200
+
+
+# route to append new circulation data (CSV or NDJSON, uploaded as "file" or sent as the body)
+@admin_bp.route("/ingest_lends", methods=["POST"])
+def ingest_lends():
+    upload = request.files.get("file")
+    data_format = request.args.get("format")
+    if upload is not None:
+        source = upload.stream
+        data_format = data_format or ("ndjson" if upload.filename.endswith((".ndjson", ".jsonl")) else "csv")
+    else:
+        source = io.BytesIO(request.get_data())
+        data_format = data_format or ("ndjson" if "json" in (request.content_type or "") else "csv")
+
+    try:
+        result = lendstore.ingest_frame(lendstore.read_batch(source, data_format))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({"message": "Transactions ingested successfully.", **result}), 201
+
+
+# route to see queue depth and batch sizes of the feedback classifier
+@admin_bp.route("/classifier_stats", methods=["GET"])
+def classifier_stats():
+    return jsonify(classifier.batching_stats()), 200
+
+
+# route to see this worker's memory, and how much of it is model weights shared with the other workers
+@admin_bp.route("/memory", methods=["GET"])
+def worker_memory():
+    weights_file = classifier.shared_weights_file()
+    try:
+        report = memory.process_memory(files=[weights_file] if weights_file else [])
+    except OSError as e:
+        logging.error(f"Could not read the process memory: {str(e)}")
+        return jsonify({"error": "Memory figures are only available on Linux."}), 501
+    report["classifier"] = {"backend": classifier.loaded_backend(), "shared_weights_file": weights_file}
+    return jsonify(report), 200
+
+
+# route to see how often repeated answers skip the model
+@admin_bp.route("/classification_cache_stats", methods=["GET"])
+def classification_cache_stats():
+    return jsonify(resultcache.result_cache.stats()), 200
+
+
+# route to re-rank every student (and their open issues) after new lending data arrives
+@admin_bp.route("/rescore_users", methods=["POST"])
+def rescore_users():
+    scores = pipeline.rescore_all_users()
+    users, issues = pipeline.save_user_scores(scores)
+
+    return jsonify({
+        "scored": len(scores),
+        "priorities": {str(k): int(v) for k, v in scores["priority"].value_counts().items()},
+        "updated_users": users,
+        "updated_issues": issues
+    }), 200
+
+
+# route to see how many queued emails were delivered, are waiting for a retry or failed
+@admin_bp.route("/outbox_status", methods=["GET"])
+def outbox_status():
+    return jsonify(mailer.outbox_status()), 200
+
+
+# route to see how many feedback submissions are still processing or failed
+@admin_bp.route("/feedback_jobs", methods=["GET"])
+def feedback_jobs():
+    return jsonify(jobs.queue_status()), 200
+
+
+# collections that can be downloaded through /export/<name>: (collection, date field, exported fields)
+EXPORTABLE_COLLECTIONS = {
+    "feedback": (feedback_collection, "date",
+                 ["email", "roll_no", "feedback_answers", "feedback_time_taken", "floor_no", "date", "issue_presence"]),
+    "issues": (issues_collection, "issue_raise_date",
+               ["_id", "raised_by", "issue", "category", "status", "user_score", "issue_raise_date", "resolved_date"]),
+    "logins": (user_logs_collection, "date", ["roll_no", "date"])
+}
+
+# route to download feedback, issues or login logs for a date range as NDJSON or CSV
+@admin_bp.route("/export/<name>", methods=["GET"])
+def export_collection(name):
+    if name not in EXPORTABLE_COLLECTIONS:
+        return jsonify({"error": f"Unknown export. Choose one of {', '.join(EXPORTABLE_COLLECTIONS)}."}), 404
+
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in ("ndjson", "csv"):
+        return jsonify({"error": "Format must be ndjson or csv."}), 400
+
+    try:
+        date_range = exports.parse_date_range(request.args.get("startDate"), request.args.get("endDate"))
+    except ValueError:
+        return jsonify({"error": "Dates must be in YYYY-MM-DD format."}), 400
+
+    collection, date_field, fields = EXPORTABLE_COLLECTIONS[name]
+    batches = exports.iter_batches(collection, fields, date_field, date_range)
+
+    if export_format == "csv":
+        body, mimetype = exports.stream_csv(batches, fields), "text/csv"
+    else:
+        body, mimetype = exports.stream_ndjson(batches), "application/x-ndjson"
+
+    return Response(stream_with_context(body), mimetype=mimetype, headers={
+        "Content-Disposition": f"attachment; filename={name}.{export_format}"
+    })
+
+
 
 
 
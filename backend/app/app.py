@@ -1,36 +1,157 @@
-from flask import Flask, session, jsonify
-from users import users_bp
-from admin import admin_bp
+import sys
+import time
+import startup
+
+# `python app.py --startup-report` prints per-import and per-initializer timings and exits
+STARTUP_REPORT = "--startup-report" in sys.argv
+_start = time.perf_counter()
+if STARTUP_REPORT:
+    startup.install_import_timer()
+
+from flask import Flask, jsonify, Response
+import classifier
+import database
+import mailer
+import indexes
+import metrics
 import dotenv
 import os
 import logging
 
 dotenv.load_dotenv()
 
-# Initialize Flask App
-app = Flask(__name__)
-app.config["SECRET_KEY"] = os.getenv("FLASK_SECRET_KEY")
-app.config["SESSION_TYPE"] = "filesystem"
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,  # Set the logging level
-    format='%(asctime)s - %(levelname)s - %(message)s',  # Log format
-    handlers=[
-        logging.FileHandler("app.log"),  # Log to a file
-        logging.StreamHandler()  # Also log to console
-    ]
-)
-
-# Register Blueprints
-app.register_blueprint(users_bp, url_prefix="/users")
-app.register_blueprint(admin_bp, url_prefix="/admin")
-
-@app.errorhandler(Exception)
-def handle_exception(e):
-    logging.error(f"An error occurred: {str(e)}")
-    return jsonify({"error": "An internal error occurred."}), 500
-
-# Run the app
+# APP_BLUEPRINTS=admin runs an admin-only worker, which never loads pandas or torch
+APP_BLUEPRINTS = [name.strip() for name in os.getenv("APP_BLUEPRINTS", "users,admin").split(",")]
+# refuse to start when MongoDB can't be reached, instead of failing every request later
+MONGO_FAIL_FAST = os.getenv("MONGO_FAIL_FAST", "true").lower() == "true"
+
+
+def preload_shared_resources():
+    """
+    Loads the read-only resources (lend history index, category matcher and,
+    with PRELOAD_MODEL, the sentiment model weights) in the current process.
+    Called in the gunicorn master before fork, so every worker shares the
+    same pages copy-on-write instead of loading its own copy. Nothing here
+    opens a Mongo connection or starts a thread.
+    """
+    import categories
+
+    with startup.timed("categories.get_engine"):
+        categories.get_engine().refresh()
+
+    if "users" in APP_BLUEPRINTS:
+        import scoring
+        try:
+            with startup.timed("scoring.get_card_index"):
+                scoring.get_card_index()
+        except Exception as e:
+            logging.error(f"Could not preload the lend history: {str(e)}")
+
+        if os.getenv("PRELOAD_MODEL", "false").lower() == "true":
+            # only the weights: running an inference here would start torch's
+            # thread pool, which doesn't survive fork
+            try:
+                with startup.timed("classifier.get_classifier"):
+                    classifier.get_classifier()
+            except Exception as e:
+                logging.error(f"Could not preload the sentiment model: {str(e)}")
+
+
+def start_background_workers():
+    """
+    Starts this process' background threads. Threads don't survive fork, so
+    under gunicorn this runs in every worker after the fork (see gunicorn.conf.py).
+    """
+    # Load (and optionally warm) the sentiment model at startup instead of on the first submission
+    if "users" in APP_BLUEPRINTS and os.getenv("WARMUP_MODEL", "false").lower() == "true":
+        try:
+            with startup.timed("classifier.warm_up"):
+                classifier.warm_up()
+        except Exception as e:
+            logging.error(f"Sentiment model warm up failed: {str(e)}")
+
+    # Deliver queued emails in the background so requests don't wait on SMTP
+    with startup.timed("mailer.start_worker"):
+        mailer.start_worker()
+
+    # Process submitted feedback in the background (admin-only workers leave that to the others)
+    if "users" in APP_BLUEPRINTS:
+        import jobs
+        with startup.timed("jobs.start_workers"):
+            jobs.start_workers()
+
+
+def create_app(start_workers=True):
+    """
+    Builds the Flask app. Pass start_workers=False when the process is about
+    to fork (gunicorn preload) and call start_background_workers in each
+    worker instead.
+    """
+    # Initialize Flask App
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = os.getenv("FLASK_SECRET_KEY")
+    app.config["SESSION_TYPE"] = "filesystem"
+
+    # Set up logging
+    logging.basicConfig(
+        level=logging.INFO,  # Set the logging level
+        format='%(asctime)s - %(levelname)s - %(message)s',  # Log format
+        handlers=[
+            logging.FileHandler("app.log"),  # Log to a file
+            logging.StreamHandler()  # Also log to console
+        ]
+    )
+
+    # Register Blueprints
+    if "users" in APP_BLUEPRINTS:
+        from users import users_bp
+        app.register_blueprint(users_bp, url_prefix="/users")
+    if "admin" in APP_BLUEPRINTS:
+        from admin import admin_bp
+        app.register_blueprint(admin_bp, url_prefix="/admin")
+
+    if MONGO_FAIL_FAST:
+        with startup.timed("database.health"):
+            status = database.health()
+        if status["status"] != "ok":
+            print(f"[-] MongoDB is unavailable ({status['latency_ms']} ms): {status['error']}")
+            raise SystemExit(1)
+        logging.info(f"MongoDB reachable in {status['latency_ms']} ms with {status['options']}")
+
+    # Make sure the login, dashboard and search queries are index backed
+    with startup.timed("indexes.ensure_indexes"):
+        indexes.ensure_indexes()
+
+    if start_workers:
+        start_background_workers()
+    else:
+        # the health check and the indexes opened a client in this process;
+        # it is about to fork, so the workers open their own (see post_fork)
+        database.close_client()
+
+    # Prometheus scrape endpoint: request latency per route, status counts and span durations
+    @app.route("/metrics", methods=["GET"])
+    def prometheus_metrics():
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    # Database health and connection pool usage (503 when MongoDB is unreachable)
+    @app.route("/health", methods=["GET"])
+    def health_check():
+        status = database.health()
+        return jsonify(status), 200 if status["status"] == "ok" else 503
+
+    @app.errorhandler(Exception)
+    def handle_exception(e):
+        logging.error(f"An error occurred: {str(e)}")
+        return jsonify({"error": "An internal error occurred."}), 500
+
+    return app
+
+
+# Run the app (development server; see gunicorn.conf.py for production)
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    app = create_app()
+    if STARTUP_REPORT:
+        print(startup.report(total=time.perf_counter() - _start))
+        sys.exit(0)
+    app.run(debug=True)
@@ -0,0 +1,387 @@
+# bench.py - reproducible benchmarks for the feedback pipeline and the routes
+#
+#   python bench.py --rows 10000 100000 --output bench.json
+#   python bench.py --rows 10000 --baseline bench.json     # compare with a saved run
+#   python bench.py compare new.json bench.json            # compare two saved runs
+#
+# Every run uses synthetic data from a fixed seed. Mongo is replaced by an
+# in-memory mongomock database (pip install mongomock), so no server is needed.
+import os
+import ast
+import sys
+import json
+import time
+import types
+import random
+import shutil
+import platform
+import tempfile
+import datetime
+import subprocess
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ANSWER_SUBJECTS = ["wifi", "the reading room", "the fans", "the staff", "the books", "the catalogue",
+                   "the washroom", "the chairs", "the lights", "the e-library computers", "the ac"]
+ANSWER_COMPLAINTS = ["is very slow", "is not working", "is broken", "is too noisy", "is dirty",
+                     "keeps disconnecting", "needs to be fixed"]
+ANSWER_PRAISE = ["is good", "is excellent", "is very helpful", "is clean and quiet", "works well"]
+COMMON_ANSWERS = ["nothing", "good", "wifi is slow", "no", "everything is fine", "nil"]
+
+
+def install_database_stand_in():
+    """
+    Registers an in-memory mongomock database as the `database` module, with
+    the same collection names database.py declares.
+    """
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit("[-] The benchmarks need mongomock: pip install mongomock")
+
+    db = mongomock.MongoClient().get_database("database")
+    stand_in = types.ModuleType("database")
+    stand_in.db = db
+    # read the `name = db.<collection>` assignments so new collections are picked up
+    with open(os.path.join(APP_DIR, "database.py")) as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Attribute) \
+                and isinstance(node.value.value, ast.Name) and node.value.value.id == "db":
+            setattr(stand_in, node.targets[0].id, db[node.value.attr])
+    sys.modules["database"] = stand_in
+    return db
+
+
+def synthetic_lend_history(rows, seed=0, now=None):
+    """
+    A lend history DataFrame with the columns of library-book-lend-history.csv:
+    about 45% lends, 45% returns and 10% fine payments over the last two years.
+    """
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    now = now or pd.Timestamp("2026-01-01")
+    cards = np.array([f"{year}N{number:03d}" for year in (21, 22, 23, 24) for number in range(1, 1000)] +
+                     [f"C{number:04d}" for number in range(1, 200)])
+    cards = cards[:max(100, min(len(cards), rows // 20))]
+
+    kinds = rng.choice(3, size=rows, p=[0.45, 0.45, 0.10])
+    amounts = np.where(kinds == 2, -rng.choice([10, 20, 40, 100], size=rows), 0).astype(float)
+    return pd.DataFrame({
+        "Date": now - pd.to_timedelta(rng.integers(0, 730 * 24 * 3600, size=rows), unit="s"),
+        "Card number": cards[rng.zipf(1.5, size=rows) % len(cards)],
+        "Transaction": np.array(["Check in", "Check out", "Payment"])[kinds],
+        "Amount": amounts.astype(str),
+    })
+
+
+def synthetic_answers(count, seed=0):
+    # a third of the answers repeat a handful of common ones, like real submissions
+    rng = random.Random(seed)
+    answers = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.33:
+            answers.append(rng.choice(COMMON_ANSWERS))
+        elif roll < 0.75:
+            answers.append(f"{rng.choice(ANSWER_SUBJECTS)} {rng.choice(ANSWER_COMPLAINTS)}")
+        else:
+            answers.append(f"{rng.choice(ANSWER_SUBJECTS)} {rng.choice(ANSWER_PRAISE)}")
+    return answers
+
+
+def measure(function, inputs, warmup=3):
+    """
+    Calls function once per input.
+
+    Returns:
+        Dict with n, p50/p95/p99/mean in ms and throughput in calls per second.
+    """
+    for item in inputs[:warmup]:
+        function(item)
+    timings = []
+    started = time.perf_counter()
+    for item in inputs:
+        call_started = time.perf_counter()
+        function(item)
+        timings.append(time.perf_counter() - call_started)
+    total = time.perf_counter() - started
+
+    timings.sort()
+
+    def percentile(p):
+        return 1000 * timings[min(len(timings) - 1, int(round(p / 100 * (len(timings) - 1))))]
+
+    return {
+        "n": len(timings),
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "mean_ms": 1000 * total / len(timings),
+        "throughput_per_s": len(timings) / total if total else 0,
+    }
+
+
+def measure_once(function):
+    started = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - started
+    return {"n": 1, "p50_ms": 1000 * seconds, "p95_ms": 1000 * seconds, "p99_ms": 1000 * seconds,
+            "mean_ms": 1000 * seconds, "throughput_per_s": 1 / seconds if seconds else 0}
+
+
+def bench_scoring(rows, calls, seed):
+    import lendstore
+    import scoring
+    import pipeline
+
+    df = synthetic_lend_history(rows, seed)
+    results = {}
+    store_dir = tempfile.mkdtemp(prefix="bench-lend-")
+    cwd = os.getcwd()
+    try:
+        results[f"lendstore.write_store[{rows}]"] = measure_once(lambda: lendstore.write_store(
+            lendstore.from_frame(df), os.path.join(store_dir, lendstore.LEND_STORE_DIR)))
+        # the app reads the store relative to its working directory
+        os.chdir(store_dir)
+        scoring._index = scoring._index_source = None
+        results[f"scoring.get_card_index[{rows}]"] = measure_once(scoring.get_card_index)
+
+        rng = random.Random(seed)
+        cards = list(scoring.get_card_index().stats.index)
+        sample = [rng.choice(cards) for _ in range(calls)]
+        results[f"calculate_feedback_score[{rows}]"] = measure(pipeline.calculate_feedback_score, sample)
+        results[f"scoring.score_all[{rows}]"] = measure_once(lambda: scoring.score_all(scoring.get_card_index()))
+    finally:
+        os.chdir(cwd)
+        scoring._index = scoring._index_source = None
+        shutil.rmtree(store_dir, ignore_errors=True)
+    return results
+
+
+def bench_classification(answers, stub_model):
+    import classifier
+    import pipeline
+    import resultcache
+
+    results = {}
+    name = "classify_feedback"
+    if stub_model:
+        # measures everything around the model; the label comes from a keyword check
+        def predict(text):
+            negative = any(word in text for word in ANSWER_COMPLAINTS + ["slow", "no"])
+            return [{"label": "NEGATIVE", "score": 0.9 if negative else 0.1},
+                    {"label": "POSITIVE", "score": 0.1 if negative else 0.9}]
+        classifier.predict = predict
+        name += "[stub-model]"
+    else:
+        try:
+            classifier.warm_up()
+        except Exception as e:
+            print(f"[-] Skipping classify_feedback, the model could not be loaded: {e} (see --stub-model)")
+            name = None
+
+    if name:
+        results[name] = measure(pipeline.classify_feedback, answers)
+        resultcache.result_cache.results.invalidate()
+        results[name.replace("classify_feedback", "classify_answer")] = measure(pipeline.classify_answer, answers)
+    results["classify_issues"] = measure(pipeline.classify_issues, answers)
+    return results
+
+
+def bench_templates(calls, seed):
+    import pipeline
+
+    rng = random.Random(seed)
+    names = [f"{rng.randint(21, 24)}n{rng.randint(1, 999):03d}" for _ in range(calls)]
+    return {
+        f"template.{builder.__name__}": measure(builder, names)
+        for builder in (pipeline.get_feedback_email_template, pipeline.get_resolved_email_template,
+                        pipeline.get_suspend_email_template, pipeline.get_pending_email_template)
+    }
+
+
+def seed_database(db, feedback_count, seed):
+    from bson import ObjectId
+
+    rng = random.Random(seed)
+    now = datetime.datetime.utcnow()
+    answers = synthetic_answers(feedback_count, seed)
+    db.questions.insert_many([
+        {"question": f"Question {i}", "options": ["Good", "Average", "Poor", "Other"]} for i in range(8)
+    ])
+    db.users.insert_one({"username": "admin", "password": "admin", "role": "admin"})
+    feedback, issues = [], []
+    for i, answer in enumerate(answers):
+        roll_no = f"{rng.randint(21, 24)}n{rng.randint(1, 999):03d}"
+        date = now - datetime.timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+        feedback.append({
+            "_id": ObjectId(), "email": f"{roll_no}@psgtech.ac.in", "roll_no": roll_no,
+            "feedback_answers": [{"question": "Anything else?", "answer": answer}],
+            "date": date, "feedback_time_taken": rng.uniform(20, 300), "floor_no": 3,
+            "issue_presence": i % 3 == 0, "status": "DONE"
+        })
+        if i % 3 == 0:
+            issues.append({
+                "raised_by": f"{roll_no}@psgtech.ac.in", "issue_raise_date": date, "user_score": rng.random(),
+                "issue": answer, "status": rng.choice(["PENDING", "RESOLVED", "SUSPENDED"]),
+                "category": rng.choice(["Technology Equipment", "Building Infrastructure", "Other Issues"]),
+                "resolved_date": ""
+            })
+    db.feedback.insert_many(feedback)
+    if issues:
+        db.issues.insert_many(issues)
+
+
+def bench_routes(db, calls, feedback_count, seed):
+    from flask import Flask
+    import users
+    import admin
+    import rollups
+
+    seed_database(db, feedback_count, seed)
+    rollups.backfill()
+
+    app = Flask(__name__)
+    app.register_blueprint(users.users_bp, url_prefix="/users")
+    app.register_blueprint(admin.admin_bp, url_prefix="/admin")
+    client = app.test_client()
+
+    rng = random.Random(seed)
+    students = [f"{rng.randint(21, 24)}n{rng.randint(1, 999):03d}@psgtech.ac.in" for _ in range(calls)]
+    answers = synthetic_answers(calls, seed + 1)
+
+    def check(response):
+        if response.status_code >= 400:
+            raise RuntimeError(f"{response.request.path} returned {response.status_code}: {response.data[:200]}")
+        return response
+
+    def submit(i):
+        check(client.post("/users/login", json={"email": students[i]}))
+        check(client.post("/users/submit_feedback", json={
+            "feedback": [{"question": "Anything else?", "answer": answers[i]}],
+            "start_time": time.time() - 60
+        }))
+
+    check(client.post("/admin/login", json={"username": "admin", "password": "admin"}))
+    requests = {
+        "POST /users/login": lambda i: check(client.post("/users/login", json={"email": students[i]})),
+        "GET /users/get_feedback_questions": lambda i: check(client.get("/users/get_feedback_questions")),
+        "POST /users/login+submit_feedback": submit,
+        "GET /admin/dashboard": lambda i: check(client.get("/admin/dashboard?days=30")),
+        "GET /admin/get_feedback_submissions": lambda i: check(client.get("/admin/get_feedback_submissions?limit=50")),
+        "GET /admin/search_feedback": lambda i: check(client.get(f"/admin/search_feedback?filter=roll_no&query={students[i][:4]}")),
+        "GET /admin/get_issue_counts": lambda i: check(client.get("/admin/get_issue_counts")),
+        "GET /admin/filter_issues": lambda i: check(client.get("/admin/filter_issues?status=PENDING")),
+    }
+    return {f"route {name}": measure(function, list(range(calls))) for name, function in requests.items()}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    os.chdir(APP_DIR)
+    db = install_database_stand_in()
+    random.seed(args.seed)
+
+    results = {}
+    for rows in args.rows:
+        results.update(bench_scoring(rows, args.calls, args.seed))
+    answers = synthetic_answers(args.answers, args.seed)
+    results.update(bench_classification(answers, args.stub_model))
+    results.update(bench_templates(args.calls, args.seed))
+    if not args.skip_routes:
+        results.update(bench_routes(db, args.calls, args.feedback, args.seed))
+
+    return {
+        "meta": {
+            "created": datetime.datetime.utcnow().isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "seed": args.seed,
+            "rows": args.rows,
+            "calls": args.calls,
+            "answers": args.answers,
+            "feedback": args.feedback,
+            "stub_model": args.stub_model,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold, min_delta_ms=0.05):
+    """
+    Prints the change of every benchmark against the baseline.
+
+    Returns:
+        Names of the benchmarks whose p50 or p95 got slower by more than
+        threshold (and by at least min_delta_ms, so timer noise on
+        microsecond benchmarks isn't flagged).
+    """
+    regressions = []
+    print(f"{'benchmark':58} {'p50 ms':>9} {'base':>9} {'change':>8} {'p95 ms':>9} {'base':>9} {'change':>8}")
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:58} {result['p50_ms']:9.3f} {'-':>9} {'new':>8}")
+            continue
+        changes, slower = {}, False
+        for key in ("p50_ms", "p95_ms"):
+            changes[key] = (result[key] - base[key]) / base[key] if base[key] else 0
+            slower = slower or (changes[key] > threshold and result[key] - base[key] >= min_delta_ms)
+        flag = " <- slower" if slower else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:58} {result['p50_ms']:9.3f} {base['p50_ms']:9.3f} {changes['p50_ms']:+8.1%} "
+              f"{result['p95_ms']:9.3f} {base['p95_ms']:9.3f} {changes['p95_ms']:+8.1%}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmarks for the feedback pipeline")
+    parser.add_argument("command", nargs="?", choices=["run", "compare"], default="run")
+    parser.add_argument("files", nargs="*", help="compare: <current.json> <baseline.json>")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000],
+                        help="lend history sizes to score against (e.g. 10000 1000000 10000000)")
+    parser.add_argument("--calls", type=int, default=200, help="calls per benchmark")
+    parser.add_argument("--answers", type=int, default=500, help="synthetic answers to classify")
+    parser.add_argument("--feedback", type=int, default=2000, help="feedback documents seeded for the routes")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--stub-model", action="store_true",
+                        help="replace the sentiment model with a keyword check (no transformers needed)")
+    parser.add_argument("--skip-routes", action="store_true")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare the run with this saved JSON file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown before flagging (0.10 = 10%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        if len(args.files) != 2:
+            parser.error("compare needs <current.json> <baseline.json>")
+        with open(args.files[0]) as f:
+            current = json.load(f)
+        with open(args.files[1]) as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(current, baseline, args.threshold, args.min_delta_ms) else 0)
+
+    report = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold, args.min_delta_ms)
+        sys.exit(1 if regressions else 0)
+    print(json.dumps(report, indent=2))
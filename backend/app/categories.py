@@ -0,0 +1,118 @@
+# categories.py - compiled keyword matcher for issue categories
+import os
+import re
+import json
+import hashlib
+import threading
+
+DEFAULT_CONFIG = "dataset/categories.json"
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def _keyword_pattern(keyword):
+    # multi-word keywords match across any whitespace
+    return r"\s+".join(re.escape(part) for part in keyword.split())
+
+
+class CategoryEngine:
+    """
+    Loads the category config once and compiles every keyword into a single
+    case-insensitive regex with word boundaries (plural "s"/"es" suffixes
+    allowed), so "ac" matches "ac" but not "access". The config file's
+    mtime is checked on every call and the regex is rebuilt when it changes.
+    """
+
+    def __init__(self, config_file):
+        self.config_file = config_file
+        self.mtime = None
+        self.misc_category = None
+        self.version = None  # hash of the config contents
+        # (regex, keyword -> category names, category names), swapped as one object on reload
+        self._compiled = (None, {}, [])
+        self._lock = threading.Lock()
+
+    def _load(self, mtime):
+        try:
+            with open(self.config_file, "rb") as f:
+                raw = f.read()
+            config = json.loads(raw)
+            categories = config["categories"]
+            misc_cat = config["misc_category"]
+        except Exception as e:
+            raise ValueError(f"Error loading {self.config_file}: {str(e)}")
+
+        keyword_categories = {}
+        for cat in categories:
+            for kw in cat["keywords"]:
+                keyword = " ".join(kw.lower().split())
+                keyword_categories.setdefault(keyword, [])
+                if cat["name"] not in keyword_categories[keyword]:
+                    keyword_categories[keyword].append(cat["name"])
+
+        # longest keywords first so "study room" wins over "room"
+        alternatives = sorted(keyword_categories, key=len, reverse=True)
+        pattern = r"\b(" + "|".join(_keyword_pattern(kw) for kw in alternatives) + r")(?:e?s)?\b"
+
+        self._compiled = (
+            re.compile(pattern, re.IGNORECASE) if alternatives else None,
+            keyword_categories,
+            [cat["name"] for cat in categories]
+        )
+        self.misc_category = misc_cat["name"]
+        self.version = hashlib.sha1(raw).hexdigest()[:16]
+        self.mtime = mtime
+
+    def refresh(self):
+        try:
+            mtime = os.stat(self.config_file).st_mtime_ns
+        except OSError as e:
+            raise ValueError(f"Error loading {self.config_file}: {str(e)}")
+        if mtime != self.mtime:
+            with self._lock:
+                if mtime != self.mtime:
+                    self._load(mtime)
+
+    def current_version(self):
+        self.refresh()
+        return self.version
+
+    def match_counts(self, text):
+        """
+        Returns the number of distinct keywords of each category found in the
+        text, in config order, for the categories with at least one match.
+        """
+        self.refresh()
+        pattern, keyword_categories, names = self._compiled
+        if pattern is None:
+            return {}
+
+        matched = {" ".join(m.lower().split()) for m in pattern.findall(text)}
+        counts = dict.fromkeys(names, 0)
+        for keyword in matched:
+            for name in keyword_categories[keyword]:
+                counts[name] += 1
+        return {name: count for name, count in counts.items() if count}
+
+    def classify(self, text):
+        match_scores = self.match_counts(text)
+        if not match_scores:
+            return self.misc_category
+
+        # Select the category with the highest match count
+        return max(match_scores.items(), key=lambda x: x[1])[0]
+
+
+def get_engine(config_file=DEFAULT_CONFIG):
+    """
+    Returns the shared engine for config_file (relative paths are resolved
+    against this directory).
+    """
+    if not os.path.isabs(config_file):
+        config_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), config_file)
+    engine = _engines.get(config_file)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.setdefault(config_file, CategoryEngine(config_file))
+    return engine
@@ -0,0 +1,520 @@
+# classifier.py - process wide registry for the sentiment model
+import os
+import time
+import hashlib
+import queue
+import threading
+import logging
+from collections import Counter
+from concurrent.futures import Future
+
+MODEL_PATH = os.getenv("MODEL_PATH", "local_model")
+# /admin/reload_model only loads model directories below this one (unset: only MODEL_PATH)
+MODELS_ROOT = os.getenv("MODELS_ROOT")
+BATCHING = os.getenv("CLASSIFIER_BATCHING", "true").lower() == "true"
+MAX_BATCH_SIZE = int(os.getenv("CLASSIFIER_MAX_BATCH_SIZE", 16))
+MAX_WAIT_MS = int(os.getenv("CLASSIFIER_MAX_WAIT_MS", 10))
+
+# torch: the PyTorch model, onnx / onnx-int8: the exported (and quantized) model on onnxruntime
+BACKEND = os.getenv("CLASSIFIER_BACKEND", "torch")
+ONNX_MODEL_FILES = {"onnx": "model.onnx", "onnx-int8": "model-int8.onnx"}
+BACKENDS = ["torch"] + list(ONNX_MODEL_FILES)
+
+# torch backend: map the weights from MODEL_PATH/weights.bin (written by
+# `python setup.py --shared-weights`) instead of loading a private copy, so all
+# worker processes read the same physical pages
+SHARED_WEIGHTS = os.getenv("CLASSIFIER_SHARED_WEIGHTS", "true").lower() == "true"
+SHARED_WEIGHTS_FILE = "weights.bin"
+SHARED_WEIGHTS_INDEX = "weights.json"
+WEIGHT_ALIGNMENT = 64  # bytes, so every tensor can be viewed in its own dtype
+
+_classifier = None
+_model_path = None
+_lock = threading.Lock()
+_batcher = None
+_versions = {}  # (model path, backend) -> fingerprint, see model_version
+
+
+class TorchClassifier:
+    """
+    The full precision PyTorch model behind a transformers pipeline.
+    """
+
+    backend = "torch"
+
+    def __init__(self, model_path):
+        from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
+
+        model = None
+        self.weights_file = None
+        if SHARED_WEIGHTS and os.path.exists(os.path.join(model_path, SHARED_WEIGHTS_INDEX)):
+            try:
+                model = load_shared_model(model_path)
+                self.weights_file = os.path.join(model_path, SHARED_WEIGHTS_FILE)
+            except Exception as e:
+                logging.error(f"Could not map the shared weights, loading a private copy: {str(e)}")
+        if model is None:
+            model = AutoModelForSequenceClassification.from_pretrained(model_path)
+
+        self.pipeline = pipeline(
+            "text-classification",
+            model=model,
+            tokenizer=AutoTokenizer.from_pretrained(model_path),
+            top_k=None
+        )
+
+    def __call__(self, text):
+        return self.pipeline(text)
+
+    def predict_batch(self, texts):
+        import torch
+
+        inputs = self.pipeline.tokenizer(texts, padding=True, truncation=True, return_tensors="pt")
+        with torch.no_grad():
+            probabilities = self.pipeline.model(**inputs).logits.softmax(dim=-1)
+        return _results(probabilities.tolist(), self.pipeline.model.config.id2label)
+
+
+class OnnxClassifier:
+    """
+    The model exported by `python setup.py --onnx`, run with onnxruntime on
+    the CPU. Never imports torch; only the tokenizer comes from transformers.
+    """
+
+    def __init__(self, model_path, backend="onnx"):
+        import onnxruntime
+        from transformers import AutoConfig, AutoTokenizer
+
+        model_file = os.path.join(model_path, ONNX_MODEL_FILES[backend])
+        if not os.path.exists(model_file):
+            raise FileNotFoundError(f"{model_file} not found, run `python setup.py --onnx` first")
+
+        self.backend = backend
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.id2label = AutoConfig.from_pretrained(model_path).id2label
+        self.session = onnxruntime.InferenceSession(model_file, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def __call__(self, text):
+        return self.predict_batch([text])[0]
+
+    def predict_batch(self, texts):
+        import numpy as np
+
+        inputs = self.tokenizer(texts, padding=True, truncation=True, return_tensors="np")
+        feed = {name: value.astype(np.int64) for name, value in inputs.items() if name in self.input_names}
+        logits = self.session.run(["logits"], feed)[0]
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        probabilities = np.exp(logits) / np.exp(logits).sum(axis=-1, keepdims=True)
+        return _results(probabilities.tolist(), self.id2label)
+
+
+def _results(probabilities, id2label):
+    return [
+        [{"label": id2label[i], "score": float(p[i])} for i in range(len(p))]
+        for p in probabilities
+    ]
+
+
+def _weights_source(model_path):
+    # the files the shared weights were exported from, to detect a stale weights.bin
+    source = {}
+    for name in ("model.safetensors", "pytorch_model.bin"):
+        path = os.path.join(model_path, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            source[name] = f"{stat.st_size}:{stat.st_mtime_ns}"
+    return source
+
+
+def export_shared_weights(model_path=MODEL_PATH):
+    """
+    Writes every parameter and buffer of the saved model into one flat file,
+    model_path/weights.bin, with their names, dtypes, shapes and offsets in
+    weights.json. Tied weights are stored once.
+
+    Returns:
+        Size of weights.bin in bytes.
+    """
+    import json
+    import torch
+    from transformers import AutoModelForSequenceClassification
+
+    model = AutoModelForSequenceClassification.from_pretrained(model_path)
+    named = list(model.named_parameters(remove_duplicate=False)) + list(model.named_buffers(remove_duplicate=False))
+    entries, stored, offset = [], {}, 0
+    tmp_path = os.path.join(model_path, SHARED_WEIGHTS_FILE + ".tmp")
+    with open(tmp_path, "wb") as f:
+        for name, tensor in named:
+            key = (tensor.data_ptr(), tuple(tensor.shape), tensor.dtype)
+            if tensor.numel() and key in stored:
+                entries.append({"name": name, "alias_of": stored[key]})
+                continue
+            stored[key] = name
+            tensor = tensor.detach().contiguous()
+            offset = -(-offset // WEIGHT_ALIGNMENT) * WEIGHT_ALIGNMENT
+            data = tensor.reshape(-1).view(torch.uint8).numpy().tobytes()
+            f.seek(offset)
+            f.write(data)
+            entries.append({
+                "name": name,
+                "dtype": str(tensor.dtype).replace("torch.", ""),
+                "shape": list(tensor.shape),
+                "offset": offset,
+                "nbytes": len(data)
+            })
+            offset += len(data)
+        f.truncate(offset)
+    os.replace(tmp_path, os.path.join(model_path, SHARED_WEIGHTS_FILE))
+
+    with open(os.path.join(model_path, SHARED_WEIGHTS_INDEX), "w") as f:
+        json.dump({"size": offset, "source": _weights_source(model_path), "tensors": entries}, f, indent=4)
+    return offset
+
+
+def load_shared_model(model_path):
+    """
+    Builds the model with its parameters and buffers as views into a
+    memory map of weights.bin. The mapping is private and never written to,
+    so its pages stay in the page cache, shared by every process that maps
+    the file (and by gunicorn workers forked after PRELOAD_MODEL).
+    """
+    import json
+    import torch
+    from transformers import AutoConfig, AutoModelForSequenceClassification
+
+    with open(os.path.join(model_path, SHARED_WEIGHTS_INDEX)) as f:
+        index = json.load(f)
+    if index["source"] != _weights_source(model_path):
+        raise ValueError(f"{SHARED_WEIGHTS_FILE} is older than the model, "
+                         "run `python setup.py --skip-download --shared-weights`")
+
+    blob = torch.from_file(os.path.join(model_path, SHARED_WEIGHTS_FILE),
+                           shared=False, size=index["size"], dtype=torch.uint8)
+    # the modules are created on the meta device: no weights are allocated or initialized
+    with torch.device("meta"):
+        model = AutoModelForSequenceClassification.from_config(AutoConfig.from_pretrained(model_path))
+
+    tensors = {}
+    for entry in index["tensors"]:
+        module_name, _, attr = entry["name"].rpartition(".")
+        module = model.get_submodule(module_name)
+        if "alias_of" in entry:
+            tensor = tensors[entry["alias_of"]]
+        else:
+            tensor = blob[entry["offset"]:entry["offset"] + entry["nbytes"]]
+            tensor = tensor.view(getattr(torch, entry["dtype"])).view(entry["shape"])
+            if attr in module._parameters:
+                tensor = torch.nn.Parameter(tensor, requires_grad=False)
+        if attr in module._parameters:
+            module._parameters[attr] = tensor
+        else:
+            module._buffers[attr] = tensor
+        tensors[entry["name"]] = tensor
+
+    missing = [name for name, tensor in list(model.named_parameters()) + list(model.named_buffers())
+               if tensor.is_meta]
+    if missing:
+        raise ValueError(f"{SHARED_WEIGHTS_FILE} has no data for {', '.join(missing)}")
+    return model.eval()
+
+
+def _build_classifier(model_path, backend=None):
+    backend = backend or BACKEND
+    if backend == "torch":
+        return TorchClassifier(model_path)
+    if backend in ONNX_MODEL_FILES:
+        return OnnxClassifier(model_path, backend)
+    raise ValueError(f"Unknown classifier backend: {backend} (expected one of {', '.join(BACKENDS)})")
+
+
+def get_classifier():
+    """
+    Returns the shared classifier, loading it on first use.
+    """
+    global _classifier, _model_path
+    if _classifier is None:
+        with _lock:
+            if _classifier is None:
+                _classifier = _build_classifier(MODEL_PATH)
+                _model_path = MODEL_PATH
+                logging.info(f"Sentiment model loaded from {MODEL_PATH} ({_classifier.backend})")
+    return _classifier
+
+
+def warm_up(text="The library is good"):
+    # run one dummy inference so the first real request doesn't pay for lazy init
+    get_classifier()(text)
+
+
+def reload_classifier(model_path=None, backend=None):
+    """
+    Swaps the shared classifier for one loaded from model_path (defaults to
+    the currently configured directory), optionally with another backend.
+    The new model is fully built before it replaces the old one, so
+    in-flight requests keep working.
+    """
+    global _classifier, _model_path, MODEL_PATH, BACKEND
+    model_path = model_path or MODEL_PATH
+    backend = backend or BACKEND
+    new_classifier = _build_classifier(model_path, backend)
+    with _lock:
+        _classifier = new_classifier
+        _model_path = model_path
+        MODEL_PATH = model_path
+        BACKEND = backend
+        _versions.clear()
+    logging.info(f"Sentiment model reloaded from {model_path} ({backend})")
+    return model_path
+
+
+def resolve_model_dir(name):
+    """
+    Maps a model directory name from a request to a path below MODELS_ROOT.
+    A pickled model can run code when loaded, so nothing outside it is accepted.
+
+    Returns:
+        The resolved directory, or None when it isn't an existing directory under MODELS_ROOT.
+    """
+    if not MODELS_ROOT:
+        return None
+    root = os.path.realpath(MODELS_ROOT)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([root, path]) != root or path == root or not os.path.isdir(path):
+        return None
+    return path
+
+
+def loaded_model_path():
+    return _model_path
+
+
+def model_version():
+    """
+    Fingerprint of the configured model directory and backend (file names,
+    sizes and mtimes), available without loading the model. It is taken
+    once and kept until reload_classifier, just like the loaded model:
+    files replaced on disk change neither until the next reload.
+    """
+    key = (MODEL_PATH, BACKEND)
+    version = _versions.get(key)
+    if version is None:
+        digest = hashlib.sha1(BACKEND.encode())
+        try:
+            for name in sorted(os.listdir(MODEL_PATH)):
+                stat = os.stat(os.path.join(MODEL_PATH, name))
+                digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        except OSError:
+            digest.update(MODEL_PATH.encode())
+        version = _versions[key] = digest.hexdigest()[:16]
+    return version
+
+
+def loaded_backend():
+    return _classifier.backend if _classifier is not None else None
+
+
+def shared_weights_file():
+    # weights.bin when the loaded model is mapped from it, else None
+    return getattr(_classifier, "weights_file", None)
+
+
+def predict_batch(texts):
+    """
+    Runs the texts through the model as one padded tensor batch.
+
+    Returns:
+        List of per-text results in the text-classification pipeline format
+        ([{"label": ..., "score": ...}, ...] for every label).
+    """
+    return get_classifier().predict_batch(texts)
+
+
+class BatchingClassifier(threading.Thread):
+    """
+    Collects concurrent predict() calls into batches of up to max_batch_size,
+    waiting at most max_wait_ms after the first queued text, and runs each
+    batch as a single forward pass.
+    """
+
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        super().__init__(name="classifier-batcher", daemon=True)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.batch_sizes = Counter()
+        self.max_queue_depth = 0
+        self.requests = 0
+        self.total_wait = 0.0
+
+    def submit(self, text):
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        with self._stats_lock:
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return future
+
+    def run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        started = time.perf_counter()
+        try:
+            results = predict_batch([text for text, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+        with self._stats_lock:
+            self.batch_sizes[len(batch)] += 1
+            self.requests += len(batch)
+            self.total_wait += sum(started - queued for _, _, queued in batch)
+
+    def stats(self):
+        with self._stats_lock:
+            batches = sum(self.batch_sizes.values())
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "requests": self.requests,
+                "batches": batches,
+                "mean_batch_size": self.requests / batches if batches else 0,
+                "mean_queue_wait_ms": 1000 * self.total_wait / self.requests if self.requests else 0,
+                "batch_size_histogram": {str(k): v for k, v in sorted(self.batch_sizes.items())},
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000
+            }
+
+
+def get_batcher():
+    global _batcher
+    if _batcher is None:
+        with _lock:
+            if _batcher is None:
+                _batcher = BatchingClassifier()
+                _batcher.start()
+    return _batcher
+
+
+def predict(text):
+    """
+    Classifies one text, sharing a forward pass with concurrent callers when
+    batching is enabled.
+    """
+    if not BATCHING:
+        return predict_batch([text])[0]
+    return get_batcher().submit(text).result()
+
+
+def batching_stats():
+    if _batcher is None:
+        return {"enabled": BATCHING, "requests": 0}
+    return {"enabled": BATCHING, **_batcher.stats()}
+
+
+PARITY_FIXTURES = os.path.join("dataset", "sentiment_fixtures.json")
+
+
+def _evaluate_backend(backend, model_path, texts):
+    # runs in its own process so the memory figures don't mix backends
+    import resource
+
+    started = time.perf_counter()
+    model = _build_classifier(model_path, backend)
+    load_seconds = time.perf_counter() - started
+
+    model.predict_batch(texts[:1])
+    results, latencies = [], []
+    for text in texts:
+        started = time.perf_counter()
+        results.append(model.predict_batch([text])[0])
+        latencies.append(time.perf_counter() - started)
+
+    latencies.sort()
+    return {
+        "predictions": [max(result, key=lambda r: r["score"]) for result in results],
+        "load_seconds": load_seconds,
+        "p50_ms": 1000 * latencies[len(latencies) // 2],
+        "p95_ms": 1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def parity_check(backends=None, model_path=None, fixtures_file=PARITY_FIXTURES):
+    """
+    Classifies the fixture texts with every backend and compares the labels
+    with the torch model (and the expected fixture labels).
+
+    Returns:
+        Dict of backend -> agreement with torch, accuracy, score drift,
+        latency and peak memory.
+    """
+    import json
+    import multiprocessing
+
+    backends = backends or BACKENDS
+    model_path = model_path or MODEL_PATH
+    with open(fixtures_file) as f:
+        fixtures = json.load(f)
+    texts = [fixture["text"] for fixture in fixtures]
+
+    context = multiprocessing.get_context("spawn")
+    evaluations = {}
+    for backend in ["torch"] + [b for b in backends if b != "torch"]:
+        with context.Pool(1) as pool:
+            evaluations[backend] = pool.apply(_evaluate_backend, (backend, model_path, texts))
+
+    reference = evaluations["torch"]["predictions"]
+    report = {}
+    for backend, evaluation in evaluations.items():
+        predictions = evaluation.pop("predictions")
+        agreement = sum(p["label"] == r["label"] for p, r in zip(predictions, reference))
+        correct = sum(p["label"] == fixture["label"] for p, fixture in zip(predictions, fixtures))
+        report[backend] = {
+            "agreement": agreement / len(texts),
+            "accuracy": correct / len(texts),
+            "max_score_drift": max(abs(p["score"] - r["score"]) for p, r in zip(predictions, reference)),
+            "drifted": [text for text, p, r in zip(texts, predictions, reference) if p["label"] != r["label"]],
+            **evaluation
+        }
+    return report
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sentiment model backends")
+    parser.add_argument("command", choices=["parity"])
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    parser.add_argument("--model-path", default=MODEL_PATH)
+    parser.add_argument("--fixtures", default=PARITY_FIXTURES)
+    parser.add_argument("--min-agreement", type=float, default=1.0,
+                        help="fail when a backend agrees with torch on fewer labels than this")
+    args = parser.parse_args()
+
+    report = parity_check(args.backends, args.model_path, args.fixtures)
+    failed = False
+    print(f"{'backend':10} {'agree':>6} {'acc':>6} {'drift':>7} {'load s':>7} {'p50 ms':>7} {'p95 ms':>7} {'rss MB':>7}")
+    for backend, row in report.items():
+        print(f"{backend:10} {row['agreement']:6.1%} {row['accuracy']:6.1%} {row['max_score_drift']:7.4f} "
+              f"{row['load_seconds']:7.2f} {row['p50_ms']:7.1f} {row['p95_ms']:7.1f} {row['max_rss_mb']:7.0f}")
+        for text in row["drifted"]:
+            print(f"  [-] label changed: {text}")
+        failed = failed or row["agreement"] < args.min_agreement
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,70 @@
+# dashboard.py - all admin dashboard figures in one round trip
+import os
+import datetime
+
+from database import feedback_collection
+from database import issues_collection
+from cache import TTLCache
+import rollups
+
+DASHBOARD_CACHE_SECONDS = int(os.getenv("DASHBOARD_CACHE_SECONDS", 30))
+
+dashboard_cache = TTLCache(ttl=DASHBOARD_CACHE_SECONDS)
+
+
+def invalidate():
+    # called after feedback or issue writes so admins see them right away
+    dashboard_cache.invalidate()
+
+
+def _issue_summary():
+    result = next(issues_collection.aggregate([
+        {"$facet": {
+            "status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+            "category": [{"$group": {"_id": "$category", "count": {"$sum": 1}}}]
+        }}
+    ]), {"status": [], "category": []})
+
+    by_status = {str(s["_id"]): s["count"] for s in result["status"]}
+    counts = {
+        "total": sum(by_status.values()),
+        "resolved": by_status.get("RESOLVED", 0),
+        "pending": by_status.get("PENDING", 0)
+    }
+    categories = {str(c["_id"]): c["count"] for c in result["category"] if c["count"] > 0}
+    return counts, categories
+
+
+def compute_dashboard(days):
+    now = datetime.datetime.utcnow()
+    # the trends read at most `days` small rollup documents (see rollups.py)
+    window = rollups.read_window(now, days)
+    feedback_daily, feedback_total = rollups.daily_counts("feedback_count", now, days, window)
+    login_daily, login_total = rollups.daily_counts("login_count", now, days, window)
+    issue_counts, issue_categories = _issue_summary()
+
+    # Last 50 feedback submissions
+    time_taken = [
+        feedback.get("feedback_time_taken", 0)
+        for feedback in feedback_collection.find({}, {"feedback_time_taken": 1}).sort("date", -1).limit(50)
+    ]
+
+    return {
+        "days": days,
+        "feedback_count": feedback_daily,
+        "login_count": login_daily,
+        "feedback_rate": feedback_total / days if days > 0 else 0,
+        "login_rate": login_total / days if days > 0 else 0,
+        "issue_counts": issue_counts,
+        "issue_categories": issue_categories,
+        "feedback_time_taken": time_taken,
+        "generated": now
+    }
+
+
+def get_dashboard(days):
+    """
+    Returns the dashboard figures for the last `days` days, recomputed at most
+    once per DASHBOARD_CACHE_SECONDS unless invalidate() is called.
+    """
+    return dashboard_cache.get_or_set(days, lambda: compute_dashboard(days))
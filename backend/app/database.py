@@ -1,16 +1,150 @@
 from pymongo import MongoClient
+import pymongo
+import metrics
 import os
+import time
+import threading
 import dotenv
-import pandas as pd
 
 dotenv.load_dotenv()
 
+# Connection pool and timeout settings: environment variable -> MongoClient option.
+# Unset ones keep pymongo's defaults (and whatever MONGO_URI sets).
+CLIENT_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": "maxPoolSize",  # connections per server, default 100
+    "MONGO_MIN_POOL_SIZE": "minPoolSize",  # kept open even when idle, default 0
+    "MONGO_MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    "MONGO_MAX_CONNECTING": "maxConnecting",  # connections being opened at once, default 2
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",  # how long a request waits for a free connection
+    "MONGO_CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+    "MONGO_SOCKET_TIMEOUT_MS": "socketTimeoutMS",
+}
+# how long to look for a reachable server before an operation (or the startup check) fails
+SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+# wire compression in order of preference, e.g. "zstd,snappy,zlib" (zstd and snappy
+# need `pip install "pymongo[zstd,snappy]"`; unavailable ones are skipped)
+COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "")
+HEALTH_CHECK_TIMEOUT_SECONDS = float(os.getenv("MONGO_HEALTH_CHECK_TIMEOUT_SECONDS", 5))
+
 # MongoDB Connection
-try:
-    mongo_client = MongoClient(os.getenv("MONGO_URI"))
-    db = mongo_client.get_database("database")
-except Exception as e:
-    print(f"[-] Database conneciton error: {e}")
+# The client is created on first use in each process: a MongoClient must not
+# be shared across fork(), so gunicorn workers each open their own even when
+# the app was imported in the master (see gunicorn.conf.py).
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def client_options():
+    """
+    Returns:
+        MongoClient keyword arguments built from the MONGO_* settings.
+    """
+    options = {"serverSelectionTimeoutMS": SERVER_SELECTION_TIMEOUT_MS}
+    for variable, option in CLIENT_OPTIONS.items():
+        value = os.getenv(variable)
+        if value:
+            options[option] = int(value)
+    if COMPRESSORS:
+        options["compressors"] = COMPRESSORS
+    return options
+
+
+def get_client():
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                if _client_pid is not None and _client_pid != os.getpid():
+                    # forked: the pool figures so far belong to the parent's client
+                    metrics.pool_monitor.reset()
+                try:
+                    # every command is timed as a "mongo.<command>" span and every
+                    # connection checkout is tracked by the pool monitor (see metrics.py)
+                    _client = MongoClient(
+                        os.getenv("MONGO_URI"),
+                        event_listeners=[metrics.MongoCommandTimer(), metrics.pool_monitor],
+                        **client_options()
+                    )
+                    _client_pid = os.getpid()
+                except Exception as e:
+                    print(f"[-] Database conneciton error: {e}")
+                    raise
+    return _client
+
+
+def get_database():
+    return get_client().get_database("database")
+
+
+def reset_client():
+    # drops this process' client; the next query opens a new one
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        elif _client_pid is not None:
+            metrics.pool_monitor.reset()
+        _client, _client_pid = None, None
+
+
+def close_client():
+    # before fork (gunicorn preload): no open sockets or pymongo monitor
+    # threads are inherited, and the workers start with empty pool figures
+    reset_client()
+    metrics.pool_monitor.reset()
+
+
+def health():
+    """
+    Pings the server within MONGO_HEALTH_CHECK_TIMEOUT_SECONDS.
+
+    Returns:
+        Dict with status "ok" or "unavailable", the ping latency, the error
+        (if any), the connection settings in use and the pool statistics.
+    """
+    started = time.perf_counter()
+    error = None
+    try:
+        with pymongo.timeout(HEALTH_CHECK_TIMEOUT_SECONDS):
+            get_client().admin.command("ping")
+    except Exception as e:
+        error = str(e)
+    return {
+        "status": "unavailable" if error else "ok",
+        "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        "error": error,
+        "options": client_options(),
+        "pool": metrics.pool_monitor.stats()
+    }
+
+
+class LazyCollection:
+    """
+    Stands in for a pymongo collection and resolves it against the current
+    process' client on every use, so module level collection handles stay
+    valid across fork().
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_database()[self.name], attr)
+
+    def __getitem__(self, name):
+        return get_database()[self.name][name]
+
+    def __repr__(self):
+        return f"LazyCollection({self.name!r})"
+
+
+class LazyDatabase:
+    def __getattr__(self, name):
+        return LazyCollection(name)
+
+
+db = LazyDatabase()
 
 # Collections
 users_collection = db.users
@@ -18,7 +152,9 @@ user_logs_collection = db.logs
 feedback_collection = db.feedback
 questions_collection = db.questions
 issues_collection = db.issues
+outbox_collection = db.outbox
+daily_stats_collection = db.daily_stats
+classification_cache_collection = db.classification_cache
+versions_collection = db.versions  # change counters, e.g. of the feedback questions (see questions.py)
 
-library_db = pd.read_csv("library-book-lend-history.csv")
-
-
+# The lend history is loaded on first use from the memory-mapped store in lendstore.py
@@ -0,0 +1,79 @@
+# exports.py - streaming NDJSON/CSV exports straight from Mongo cursors
+import io
+import csv
+import json
+import datetime
+from bson import ObjectId
+
+EXPORT_BATCH_SIZE = 500
+
+
+def parse_date_range(start_date=None, end_date=None):
+    """
+    Builds a Mongo range filter from YYYY-MM-DD strings. The end date is
+    inclusive. Raises ValueError on malformed dates.
+    """
+    date_range = {}
+    if start_date:
+        date_range["$gte"] = datetime.datetime.strptime(start_date, "%Y-%m-%d")
+    if end_date:
+        date_range["$lt"] = datetime.datetime.strptime(end_date, "%Y-%m-%d") + datetime.timedelta(days=1)
+    return date_range
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    return str(value)
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, default=_json_default)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+def iter_batches(collection, fields, date_field, date_range, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields lists of up to batch_size documents, oldest first, holding only
+    one batch in memory at a time.
+    """
+    filters = {date_field: date_range} if date_range else {}
+    projection = {field: 1 for field in fields}
+    if "_id" not in fields:
+        projection["_id"] = 0
+    cursor = collection.find(filters, projection).sort(date_field, 1).batch_size(batch_size)
+
+    batch = []
+    for document in cursor:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_ndjson(batches):
+    for batch in batches:
+        yield "".join(json.dumps(document, default=_json_default) + "\n" for document in batch)
+
+
+def stream_csv(batches, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    yield buffer.getvalue()
+
+    for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        for document in batch:
+            writer.writerow([_csv_value(document.get(field)) for field in fields])
+        yield buffer.getvalue()
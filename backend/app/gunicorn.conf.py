@@ -0,0 +1,34 @@
+# gunicorn.conf.py - multi-process serving: gunicorn -c gunicorn.conf.py wsgi:app
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+# one worker process by default: the login state in users.py / admin.py is a
+# per-process dict, so with several workers a login is only known to the worker
+# that handled it. Scale with GUNICORN_THREADS until sessions move to flask.session.
+workers = int(os.getenv("WEB_CONCURRENCY", 1))
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+
+# import the app once in the master so the lend history index, category matcher
+# and (with PRELOAD_MODEL) model weights are shared copy-on-write by all workers
+preload_app = True
+wsgi_app = "wsgi:app"
+# tells wsgi.py to leave the background workers to post_fork
+os.environ["GUNICORN_PRELOAD_APP"] = "true"
+
+
+def on_starting(server):
+    if workers > 1:
+        server.log.warning(f"WEB_CONCURRENCY={workers}: logins are kept per worker process, "
+                           "so requests handled by another worker will see the user as logged out")
+
+
+def post_fork(server, worker):
+    # per worker resources: a fresh Mongo client (the master's must not be reused
+    # across fork) and the outbox / feedback job threads, which don't survive fork
+    import database
+    import app
+
+    database.reset_client()
+    app.start_background_workers()
+    server.log.info(f"Worker {worker.pid} started its Mongo client and background workers")
@@ -0,0 +1,132 @@
+# indexes.py - declared indexes for every collection and a query plan report
+import sys
+import logging
+import datetime
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+
+from database import users_collection
+from database import user_logs_collection
+from database import feedback_collection
+from database import issues_collection
+from database import outbox_collection
+from database import classification_cache_collection
+from resultcache import CLASSIFICATION_CACHE_TTL_DAYS
+
+# Indexes required by the hot queries, per collection
+INDEXES = {
+    users_collection: [
+        IndexModel([("email", ASCENDING), ("role", ASCENDING)]),  # users.login
+        IndexModel([("role", ASCENDING), ("username", ASCENDING)]),  # admin.login, view_last_logins
+        IndexModel([("roll_no", ASCENDING), ("role", ASCENDING)]),  # pipeline.save_user_scores
+    ],
+    user_logs_collection: [
+        IndexModel([("date", ASCENDING)]),  # login_count / login_rate
+    ],
+    feedback_collection: [
+        IndexModel([("date", DESCENDING), ("_id", DESCENDING)]),  # pagination, trends, exports
+        IndexModel([("roll_no", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("next_attempt", ASCENDING)]),  # jobs.FeedbackWorker
+        IndexModel([("feedback_answers.answer", TEXT)]),
+    ],
+    issues_collection: [
+        IndexModel([("status", ASCENDING), ("category", ASCENDING)]),
+        IndexModel([("raised_by", ASCENDING)]),  # filter_issues, pipeline.save_user_scores
+        IndexModel([("issue_raise_date", DESCENDING)]),
+        IndexModel([("created_date", ASCENDING)]),  # issuevotes.IssueIndex.refresh
+        IndexModel([("issue", TEXT)]),
+    ],
+    outbox_collection: [
+        IndexModel([("status", ASCENDING), ("next_attempt", ASCENDING)]),
+    ],
+    classification_cache_collection: [
+        # TTL: results of replaced models and categories expire instead of being deleted
+        IndexModel([("created", ASCENDING)], expireAfterSeconds=CLASSIFICATION_CACHE_TTL_DAYS * 86400),
+    ],
+}
+
+
+def _days_ago(days):
+    return datetime.datetime.utcnow() - datetime.timedelta(days=days)
+
+
+# Query shapes run by the routes: (name, collection, filter, sort)
+QUERY_SHAPES = [
+    ("users.login", users_collection, {"email": "23n201@psgtech.ac.in", "role": "user"}, None),
+    ("admin.login", users_collection, {"username": "admin", "role": "admin"}, None),
+    ("admin.view_last_logins", users_collection, {"role": "admin"}, None),
+    ("admin.login_count", user_logs_collection, {"date": {"$gte": _days_ago(30)}}, None),
+    ("admin.feedback_count", feedback_collection, {"date": {"$gte": _days_ago(30)}}, None),
+    ("admin.get_feedback_submissions", feedback_collection, {}, [("date", -1), ("_id", -1)]),
+    ("admin.feedback_time_taken", feedback_collection, {}, [("date", -1)]),
+    ("admin.search_feedback roll_no", feedback_collection, {"roll_no": {"$regex": "^23n"}}, None),
+    ("admin.search_feedback keyword", feedback_collection, {"$text": {"$search": "wifi"}}, None),
+    ("admin.get_issue_counts", issues_collection, {"status": "PENDING"}, None),
+    ("admin.filter_issues", issues_collection, {"status": "PENDING", "category": "Other Issues"}, None),
+    ("admin.filter_issues user", issues_collection, {"raised_by": {"$regex": "^23n"}}, None),
+    ("pipeline.save_user_scores", issues_collection,
+     {"raised_by": "23n201@psgtech.ac.in", "status": {"$ne": "RESOLVED"}}, None),
+    ("jobs.feedback", feedback_collection, {"status": "PROCESSING", "next_attempt": {"$lte": datetime.datetime.utcnow()}},
+     [("next_attempt", 1)]),
+    ("mailer.outbox", outbox_collection, {"status": "QUEUED", "next_attempt": {"$lte": datetime.datetime.utcnow()}},
+     [("next_attempt", 1)]),
+]
+
+
+def ensure_indexes():
+    """
+    Creates the declared indexes. Safe to call on every start: existing
+    indexes with the same definition are left alone.
+    """
+    for collection, models in INDEXES.items():
+        try:
+            collection.create_indexes(models)
+        except Exception as e:
+            logging.error(f"Could not create indexes on {collection.name}: {str(e)}")
+
+
+def _plan_stages(plan):
+    # every stage name in a (nested) winning plan
+    stages = [plan.get("stage")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return [stage for stage in stages if stage]
+
+
+def explain_query_shapes():
+    """
+    Runs explain() on every registered query shape.
+
+    Returns:
+        List of (name, collection name, winning plan stages) tuples.
+    """
+    report = []
+    for name, collection, filters, sort in QUERY_SHAPES:
+        cursor = collection.find(filters)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        report.append((name, collection.name, _plan_stages(plan)))
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Index bootstrap and query plan report")
+    parser.add_argument("command", choices=["ensure", "explain"])
+    args = parser.parse_args()
+
+    if args.command == "ensure":
+        ensure_indexes()
+        for collection in INDEXES:
+            print(f"{collection.name}: {', '.join(sorted(collection.index_information()))}")
+    else:
+        collscans = 0
+        for name, collection_name, stages in explain_query_shapes():
+            flag = "COLLSCAN" if "COLLSCAN" in stages else "ok"
+            collscans += flag == "COLLSCAN"
+            print(f"[{flag:8}] {name:40} {collection_name:10} {' <- '.join(stages)}")
+        sys.exit(1 if collscans else 0)
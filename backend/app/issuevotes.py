@@ -0,0 +1,348 @@
+# issuevotes.py - groups duplicate issue reports into one issue with a vote count
+import os
+import re
+import zlib
+import logging
+import threading
+import datetime
+from bson import ObjectId
+
+from database import issues_collection
+from startup import lazy_import
+
+np = lazy_import("numpy")
+
+ISSUE_INDEX_DIR = os.getenv("ISSUE_INDEX_DIR", "issue_index")
+# cosine similarity above which a new report counts as a vote for an open issue
+SIMILARITY_THRESHOLD = float(os.getenv("ISSUE_SIMILARITY_THRESHOLD", 0.8))
+OPEN_STATUSES = ["PENDING"]
+DIMENSIONS = 256
+TOP_K = 5
+SAVE_EVERY = 100  # new rows before index.npz is rewritten
+INDEX_FILE = "index.npz"
+EMBEDDING_VERSION = 2  # bump when embed() changes, saved indexes of other versions are re-embedded
+# issues are inserted by workers in several processes, with retries, so a lookup
+# also rechecks the issues created this long before the newest one it has seen
+CATCH_UP_WINDOW = datetime.timedelta(seconds=int(os.getenv("ISSUE_INDEX_CATCH_UP_SECONDS", 600)))
+
+
+STOP_WORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "been", "in", "on", "at", "of", "to", "for",
+    "and", "or", "it", "its", "this", "that", "there", "very", "too", "so", "please", "library", "i", "we",
+    # the way problems are reported, not what they are about
+    "not", "no", "working", "work", "works", "doesn", "isn", "t", "does", "has", "have", "getting", "keeps", "properly"
+}
+
+
+# words that say what is wrong rather than with what: they count, but much less than the thing itself
+SYMPTOM_WORDS = {
+    "slow", "broken", "dirty", "down", "cold", "hot", "noisy", "loud", "bad", "poor", "damaged", "missing",
+    "old", "less", "more", "many", "much", "clean", "fix", "repair", "issue", "problem", "often", "always"
+}
+SYMPTOM_WEIGHT = 0.3
+
+
+def _features(text):
+    """
+    Content words plus their character 3-4 grams, so "wifi" / "wi-fi" /
+    "wifis" stay close.
+
+    Returns:
+        List of (feature, weight) pairs.
+    """
+    words = [word[:-1] if len(word) > 3 and word.endswith("s") else word
+             for word in re.findall(r"[a-z0-9]+", re.sub(r"(?<=[a-z])-(?=[a-z])", "", text.lower()))
+             if word not in STOP_WORDS]
+    features = []
+    for word in words:
+        weight = SYMPTOM_WEIGHT if word in SYMPTOM_WORDS else 1.0
+        padded = f" {word} "
+        features.append((word, weight))
+        for n in (3, 4):
+            features += [(padded[i:i + n], weight) for i in range(len(padded) - n + 1)]
+    return features
+
+
+def embed(texts):
+    """
+    Hashed bag of words and character n-grams, L2 normalized, so the dot
+    product of two rows is their cosine similarity. crc32 keeps the hashing
+    stable across processes (unlike hash()).
+
+    Returns:
+        float32 array of shape (len(texts), DIMENSIONS).
+    """
+    vectors = np.zeros((len(texts), DIMENSIONS), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for feature, weight in _features(text):
+            bucket = zlib.crc32(feature.encode())
+            # the sign bit spreads hash collisions around zero instead of piling them up
+            vectors[row, bucket % DIMENSIONS] += weight if bucket & 0x80000000 else -weight
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class IssueIndex:
+    """
+    Normalized embeddings of every issue text, one row per issue, kept in
+    memory and persisted to ISSUE_INDEX_DIR/index.npz together with the
+    issue ids. On the first lookup every issue id in Mongo is checked
+    against the saved index; after that, issues created within
+    CATCH_UP_WINDOW of the newest one seen (by created_date, not _id, which
+    is assigned at submission) are checked before each search. Missing ones
+    are embedded once and appended.
+    """
+
+    def __init__(self, path=ISSUE_INDEX_DIR):
+        self.path = path
+        self._buffer = None  # rows beyond the published ones are free space for appends
+        self._rows = (None, [])  # (vectors, ids), swapped as one object so searches never see them mismatched
+        self.positions = {}
+        self.newest_created = None
+        self.unsaved = 0
+        self.loaded = False
+        self._lock = threading.RLock()
+
+    @property
+    def ids(self):
+        return self._rows[1]
+
+    def _load(self):
+        try:
+            with np.load(os.path.join(self.path, INDEX_FILE)) as saved:
+                if int(saved["embedding_version"]) != EMBEDDING_VERSION:
+                    raise ValueError("it was built with another embedding version")
+                vectors = saved["vectors"]
+                ids = [str(i) for i in saved["ids"]]
+            if vectors.shape != (len(ids), DIMENSIONS):
+                raise ValueError("its vectors and ids don't match")
+        except FileNotFoundError:
+            vectors, ids = np.zeros((0, DIMENSIONS), dtype=np.float32), []
+        except Exception as e:
+            logging.error(f"Could not load the issue index, rebuilding it: {str(e)}")
+            vectors, ids = np.zeros((0, DIMENSIONS), dtype=np.float32), []
+        self._buffer = vectors
+        self._publish(len(ids), ids)
+        self.loaded = True
+
+    def _publish(self, count, ids):
+        new_ids = ids[len(self.positions):]
+        self.positions.update((issue_id, i) for i, issue_id in enumerate(new_ids, len(self.positions)))
+        self._rows = (self._buffer[:count], ids)
+
+    def save(self):
+        with self._lock:
+            vectors, ids = self._rows
+            os.makedirs(self.path, exist_ok=True)
+            # vectors and ids go into one file, replaced in one step; the temporary name
+            # is per process and thread so concurrent saves never write into each other
+            tmp_path = os.path.join(self.path, f"index.{os.getpid()}.{threading.get_ident()}.tmp.npz")
+            with open(tmp_path, "wb") as f:
+                np.savez(f, vectors=vectors, ids=np.array(ids, dtype="U24"), embedding_version=EMBEDDING_VERSION)
+            os.replace(tmp_path, os.path.join(self.path, INDEX_FILE))
+            self.unsaved = 0
+
+    def add(self, issue_ids, texts):
+        with self._lock:
+            if not self.loaded:
+                self._load()
+            new = {str(i): t for i, t in zip(issue_ids, texts) if str(i) not in self.positions}
+            if not new:
+                return
+            vectors, ids = self._rows
+            count = len(ids) + len(new)
+            if self._buffer is None or count > len(self._buffer):
+                # grow by doubling so appends don't copy the whole matrix every time
+                buffer = np.zeros((max(1024, 2 * count), DIMENSIONS), dtype=np.float32)
+                buffer[:len(ids)] = vectors
+                self._buffer = buffer
+            self._buffer[len(ids):count] = embed(list(new.values()))
+            self._publish(count, ids + list(new))
+            self.unsaved += len(new)
+            if self.unsaved >= SAVE_EVERY:
+                self.save()
+
+    def _catch_up(self, filters):
+        issues = list(issues_collection.find(filters, {"created_date": 1}))
+        created = [issue["created_date"] for issue in issues if issue.get("created_date")]
+        if created:
+            newest = max(created)
+            self.newest_created = newest if self.newest_created is None else max(self.newest_created, newest)
+        missing = [issue["_id"] for issue in issues if str(issue["_id"]) not in self.positions]
+        if missing:
+            texts = {issue["_id"]: str(issue.get("issue", ""))
+                     for issue in issues_collection.find({"_id": {"$in": missing}}, {"issue": 1})}
+            self.add(missing, [texts.get(issue_id, "") for issue_id in missing])
+
+    def refresh(self):
+        if not self.loaded:
+            with self._lock:
+                if not self.loaded:
+                    self._load()
+                    # whatever was raised while this process wasn't running, in any _id order
+                    self._catch_up({})
+                    return
+        if self.newest_created is None:
+            self._catch_up({"created_date": {"$exists": True}})
+        else:
+            self._catch_up({"created_date": {"$gte": self.newest_created - CATCH_UP_WINDOW}})
+
+    def top_k(self, text, k=TOP_K):
+        """
+        Returns up to k (issue id, cosine similarity) pairs, most similar first.
+        """
+        self.refresh()
+        vectors, ids = self._rows
+        if not ids:
+            return []
+        similarities = vectors @ embed([text])[0]
+        k = min(k, len(ids))
+        best = np.argpartition(-similarities, k - 1)[:k]
+        best = best[np.argsort(-similarities[best])]
+        return [(ids[i], float(similarities[i])) for i in best]
+
+    def find_open_duplicate(self, text, category, threshold=SIMILARITY_THRESHOLD):
+        """
+        Finds the most similar open issue of the same category above the
+        threshold. Requiring the category keeps e.g. an AC report from
+        becoming a vote on a similarly worded wifi issue.
+
+        Returns:
+            (issue id, similarity) or None.
+        """
+        candidates = [(i, s) for i, s in self.top_k(text) if s >= threshold]
+        if not candidates:
+            return None
+        open_ids = {str(issue["_id"]) for issue in issues_collection.find(
+            {"_id": {"$in": [ObjectId(i) for i, _ in candidates]}, "status": {"$in": OPEN_STATUSES}, "category": category},
+            {"_id": 1}
+        )}
+        for issue_id, similarity in candidates:
+            if issue_id in open_ids:
+                return ObjectId(issue_id), similarity
+        return None
+
+
+issue_index = IssueIndex()
+
+
+def raise_or_vote(issue_id, email, text, raised_date, user_score, category):
+    """
+    Adds a vote to the most similar open issue of the same category, or
+    raises a new issue with _id issue_id when there is none. Safe to retry with the same issue_id.
+
+    Returns:
+        (id of the issue that got the report, True when it was a vote).
+    """
+    try:
+        duplicate = issue_index.find_open_duplicate(text, category)
+    except Exception as e:
+        # never lose a report because the index is unavailable
+        logging.error(f"Issue similarity lookup failed: {str(e)}")
+        duplicate = None
+
+    if duplicate is not None and duplicate[0] != issue_id:
+        cluster_id, similarity = duplicate
+        # issues raised before votes existed count as one vote
+        issues_collection.update_one({"_id": cluster_id, "votes": {"$exists": False}}, {"$set": {"votes": 1}})
+        # the report id guards against counting a retried vote twice
+        issues_collection.update_one(
+            {"_id": cluster_id, "reports.report_id": {"$ne": issue_id}},
+            {
+                "$inc": {"votes": 1},
+                "$push": {"reports": {
+                    "report_id": issue_id, "raised_by": email, "issue": text,
+                    "date": raised_date, "similarity": round(similarity, 4)
+                }}
+            }
+        )
+        return cluster_id, True
+
+    issues_collection.update_one({"_id": issue_id}, {"$setOnInsert": {
+        "created_date": datetime.datetime.utcnow(),  # when it was inserted, see IssueIndex.refresh
+        "raised_by": email,
+        "issue_raise_date": raised_date,
+        "user_score": user_score,
+        "issue": text,
+        "status": "PENDING",
+        "category": category,
+        "resolved_date": "",
+        "votes": 1,
+        "reports": []
+    }}, upsert=True)
+    try:
+        issue_index.add([issue_id], [text])
+    except Exception as e:
+        logging.error(f"Could not add issue to the similarity index: {str(e)}")
+    return issue_id, False
+
+
+PAIR_FIXTURES = os.path.join("dataset", "issue_pairs.json")
+
+
+def check_pairs(fixtures_file=PAIR_FIXTURES, threshold=SIMILARITY_THRESHOLD):
+    """
+    Scores the fixture pairs of issue texts: duplicates must reach the
+    threshold, reports about different things must stay below it.
+
+    Returns:
+        List of (first, second, similarity, expected duplicate) for every pair.
+    """
+    import json
+
+    with open(fixtures_file) as f:
+        pairs = json.load(f)
+    vectors = embed([text for pair in pairs for text in (pair["first"], pair["second"])])
+    return [
+        (pair["first"], pair["second"], float(vectors[2 * i] @ vectors[2 * i + 1]), pair["duplicate"])
+        for i, pair in enumerate(pairs)
+    ]
+
+
+def rebuild(path=ISSUE_INDEX_DIR):
+    """
+    Re-embeds every issue and rewrites index.npz.
+
+    Returns:
+        Number of issues in the index.
+    """
+    index = IssueIndex(path)
+    index.loaded = True  # start empty instead of loading the old files
+    issues = list(issues_collection.find({}, {"issue": 1}).sort("_id", 1))
+    index.add([issue["_id"] for issue in issues], [str(issue.get("issue", "")) for issue in issues])
+    index.save()
+    return len(index.ids)
+
+
+if __name__ == "__main__":
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Duplicate issue index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("rebuild", help="re-embed every issue")
+    similar_parser = subparsers.add_parser("similar", help="show the issues most similar to a text")
+    similar_parser.add_argument("text")
+    check_parser = subparsers.add_parser("check", help="score the duplicate / different fixture pairs")
+    check_parser.add_argument("--fixtures", default=PAIR_FIXTURES)
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        print(f"Indexed {rebuild()} issues in {ISSUE_INDEX_DIR}")
+    elif args.command == "check":
+        import sys
+
+        failed = False
+        for first, second, similarity, duplicate in check_pairs(args.fixtures):
+            wrong = (similarity >= SIMILARITY_THRESHOLD) != duplicate
+            failed = failed or wrong
+            print(f"{'[-]' if wrong else '   '} {similarity:.3f}  {'same' if duplicate else 'diff'}  {first} | {second}")
+        sys.exit(1 if failed else 0)
+    else:
+        issue_index.refresh()
+        started = time.perf_counter()
+        matches = issue_index.top_k(args.text)
+        print(f"Searched {len(issue_index.ids)} issues in {(time.perf_counter() - started) * 1000:.2f} ms")
+        for issue_id, similarity in matches:
+            issue = issues_collection.find_one({"_id": ObjectId(issue_id)})
+            print(f"{similarity:.3f}  {issue_id}  {issue.get('status')}  {issue.get('issue')}")
@@ -0,0 +1,315 @@
+# jobs.py - background processing of submitted feedback
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+
+from database import users_collection
+from database import feedback_collection
+import pipeline
+import dashboard
+import rollups
+import metrics
+import issuevotes
+import classifier
+
+FEEDBACK_WORKERS = int(os.getenv("FEEDBACK_WORKERS", 2))
+MAX_ATTEMPTS = int(os.getenv("FEEDBACK_JOB_MAX_ATTEMPTS", 5))
+BACKOFF_SECONDS = int(os.getenv("FEEDBACK_JOB_BACKOFF_SECONDS", 10))
+# submissions a worker claims and processes at once: their classify stages run
+# concurrently, so the sentiment model sees them as one batch (see classifier.BatchingClassifier)
+JOB_BATCH_SIZE = int(os.getenv("FEEDBACK_JOB_BATCH_SIZE", classifier.MAX_BATCH_SIZE))
+POLL_SECONDS = 5
+STALE_CLAIM_SECONDS = 600  # reclaim submissions left claimed by a crashed worker
+
+# A submission is stored with status PROCESSING and goes through these stages
+# in order. Each finished stage is recorded in "stages_done" together with its
+# results, so a retried submission resumes at the stage that failed.
+STAGES = ["score", "classify", "issue", "mail", "user", "rollup"]
+
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def submit(email, roll_no, feedback_answers, submission_time, time_taken):
+    """
+    Stores a feedback submission for background processing. This is the only
+    write made while the student waits.
+
+    Returns:
+        ObjectId of the feedback document.
+    """
+    result = feedback_collection.insert_one({
+        "email": email,
+        "roll_no": roll_no,
+        "feedback_answers": feedback_answers,
+        "date": submission_time,
+        "feedback_time_taken": time_taken,
+        "floor_no": 3,
+        "issue_presence": False,
+        "status": "PROCESSING",
+        "stages_done": [],
+        "attempts": 0,
+        "next_attempt": submission_time,
+        "last_error": None
+    })
+    _wakeup.set()
+    return result.inserted_id
+
+
+def _stage_score(job):
+    uid = job["roll_no"]
+    if uid[0].isdigit():
+        user_score, priority = pipeline.calculate_feedback_score(uid.upper())
+    else:
+        # it should check the staff ID with the email address
+        # as of now for staff we can give score as 1.0
+        user_score, priority = 1.0, 'high'
+    return {"user_score": float(user_score), "priority": priority}
+
+
+def _stage_classify(job):
+    label, confidence, category = pipeline.classify_answer(job["feedback_answers"][-1]['answer'])
+    return {
+        "label": label,
+        "confidence": float(confidence),
+        "category": category,
+        "issue_presence": label == 'ISSUE'
+    }
+
+
+def _stage_issue(job):
+    if not job["issue_presence"]:
+        return {}
+    # a report of an already open problem becomes a vote on that issue (see issuevotes.py);
+    # a new issue shares the feedback's _id, so a retry can't raise it twice
+    issue_id, voted = issuevotes.raise_or_vote(
+        job["_id"], job["email"], job["feedback_answers"][-1]['answer'],
+        job["date"], job["user_score"], job["category"]
+    )
+    return {"issue_id": issue_id, "issue_vote": voted}
+
+
+def _stage_mail(job):
+    # send thank you mail (queued in the outbox, see mailer.py); keyed by the
+    # submission, so a retry after the mail was queued doesn't queue it again
+    pipeline.send_tks_mail(job["email"], job["roll_no"], key=f"{job['_id']}:tks")
+    return {}
+
+
+def _stage_user(job):
+    # Update user collection with last feedback time
+    users_collection.update_one({"email": job["email"]}, {"$set": {"last_feedback": job["date"]}})
+    return {}
+
+
+def _stage_rollup(job):
+    # the rollup lives in another collection, so the submission is marked as
+    # counted first: a retry then can't add it twice, and a crash right after
+    # the marker loses one count until the next `python rollups.py backfill`
+    marked = feedback_collection.update_one(
+        {"_id": job["_id"], "rollup_counted": {"$ne": True}},
+        {"$set": {"rollup_counted": True}}
+    )
+    if marked.modified_count:
+        # a vote raised no issue document, so it isn't counted as an issue (like rollups.backfill)
+        category = None if job.get("issue_vote") else job.get("category")
+        rollups.record_feedback(job["date"], job["feedback_time_taken"], category)
+    dashboard.invalidate()
+    return {}
+
+
+_STAGE_FUNCTIONS = {
+    "score": _stage_score,
+    "classify": _stage_classify,
+    "issue": _stage_issue,
+    "mail": _stage_mail,
+    "user": _stage_user,
+    "rollup": _stage_rollup,
+}
+
+
+def process(job):
+    """
+    Runs the stages the submission hasn't finished yet, saving each stage's
+    results as soon as it completes. Raises when a stage fails.
+    """
+    for stage in STAGES:
+        if stage in job["stages_done"]:
+            continue
+        with metrics.span(f"job.{stage}"):
+            results = _STAGE_FUNCTIONS[stage](job)
+        feedback_collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": results, "$push": {"stages_done": stage}}
+        )
+        job.update(results)
+        job["stages_done"].append(stage)
+
+    feedback_collection.update_one({"_id": job["_id"]}, {"$set": {
+        "status": "DONE",
+        "processed_date": datetime.utcnow(),
+        "last_error": None
+    }})
+
+
+class FeedbackWorker(threading.Thread):
+    """
+    Claims up to batch_size PROCESSING submissions at a time and runs their
+    stages, one thread per submission, so their answers are classified in
+    one forward pass. A failed submission is retried with exponential
+    backoff from the failed stage until MAX_ATTEMPTS, after which it is
+    marked FAILED.
+    """
+
+    def __init__(self, number=0, batch_size=JOB_BATCH_SIZE):
+        super().__init__(name=f"feedback-worker-{number}", daemon=True)
+        self.batch_size = max(1, batch_size)
+        self._stop_event = threading.Event()
+        self._executor = ThreadPoolExecutor(self.batch_size, thread_name_prefix=f"feedback-worker-{number}-job")
+
+    def stop(self):
+        self._stop_event.set()
+        _wakeup.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            batch = self._claim_batch()
+            if not batch:
+                _wakeup.wait(POLL_SECONDS)
+                _wakeup.clear()
+                continue
+
+            if len(batch) == 1:
+                self._run(batch[0])
+            else:
+                list(self._executor.map(self._run, batch))
+        self._executor.shutdown()
+
+    def _claim_batch(self):
+        # up to batch_size submissions; the ones already claimed are kept if a later claim fails
+        batch = []
+        try:
+            while len(batch) < self.batch_size:
+                job = self._claim_next()
+                if job is None:
+                    break
+                batch.append(job)
+        except Exception as e:
+            logging.error(f"Feedback job claim failed: {str(e)}")
+        return batch
+
+    def _claim_next(self):
+        now = datetime.utcnow()
+        return feedback_collection.find_one_and_update(
+            {"status": "PROCESSING", "$or": [
+                {"claimed_date": None, "next_attempt": {"$lte": now}},
+                {"claimed_date": {"$lte": now - timedelta(seconds=STALE_CLAIM_SECONDS)}}
+            ]},
+            {"$set": {"claimed_date": now}},
+            sort=[("next_attempt", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _run(self, job):
+        try:
+            process(job)
+        except Exception as e:
+            attempts = job.get("attempts", 0) + 1
+            failed = attempts >= MAX_ATTEMPTS
+            feedback_collection.update_one({"_id": job["_id"]}, {"$set": {
+                "status": "FAILED" if failed else "PROCESSING",
+                "attempts": attempts,
+                "claimed_date": None,
+                "next_attempt": datetime.utcnow() + timedelta(seconds=BACKOFF_SECONDS * 2 ** (attempts - 1)),
+                "last_error": str(e)
+            }})
+            logging.error(f"Feedback {job['_id']} failed (attempt {attempts}): {str(e)}")
+
+
+def start_workers(count=FEEDBACK_WORKERS):
+    """
+    Starts the feedback workers for this process (once).
+    """
+    with _workers_lock:
+        _workers[:] = [worker for worker in _workers if worker.is_alive()]
+        for number in range(len(_workers), count):
+            worker = FeedbackWorker(number)
+            worker.start()
+            _workers.append(worker)
+    return list(_workers)
+
+
+def stop_workers():
+    with _workers_lock:
+        for worker in _workers:
+            worker.stop()
+        for worker in _workers:
+            worker.join(timeout=10)
+        _workers.clear()
+
+
+def job_status(feedback_id, email=None):
+    """
+    Progress of one submission (only the submitter's when email is given).
+
+    Returns:
+        Dict with the status and stages, or None when not found.
+    """
+    filters = {"_id": feedback_id}
+    if email:
+        filters["email"] = email
+    job = feedback_collection.find_one(filters, {"status": 1, "stages_done": 1, "attempts": 1,
+                                                 "issue_presence": 1, "category": 1, "last_error": 1})
+    if job is None:
+        return None
+    # submissions stored before the job queue existed have no status
+    status = job.get("status", "DONE")
+    stages_done = job.get("stages_done", STAGES if status == "DONE" else [])
+    return {
+        "feedback_id": str(job["_id"]),
+        "status": status,
+        "stages_done": stages_done,
+        "stages": STAGES,
+        "progress": len(stages_done) / len(STAGES),
+        "attempts": job.get("attempts", 0),
+        "issue_presence": job.get("issue_presence"),
+        "category": job.get("category"),
+        "error": job.get("last_error") if status == "FAILED" else None
+    }
+
+
+def queue_status():
+    # count of submissions per processing status
+    counts = feedback_collection.aggregate([
+        {"$match": {"status": {"$in": ["PROCESSING", "FAILED"]}}},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+    ])
+    return {str(c["_id"]): c["count"] for c in counts}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Feedback processing workers")
+    parser.add_argument("command", choices=["work", "retry-failed"])
+    parser.add_argument("--workers", type=int, default=FEEDBACK_WORKERS)
+    args = parser.parse_args()
+
+    if args.command == "retry-failed":
+        result = feedback_collection.update_many({"status": "FAILED"}, {"$set": {
+            "status": "PROCESSING", "attempts": 0, "claimed_date": None, "next_attempt": datetime.utcnow()
+        }})
+        print(f"Requeued {result.modified_count} submissions")
+    else:
+        # a separate worker process, e.g. next to admin-only web workers
+        workers = start_workers(args.workers)
+        print(f"Processing feedback with {len(workers)} workers")
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            stop_workers()
@@ -0,0 +1,331 @@
+# lendstore.py - columnar, memory-mapped copy of the library lend history
+import os
+import json
+import shutil
+import datetime
+from contextlib import contextmanager
+
+from startup import lazy_import
+
+np = lazy_import("numpy")
+
+try:
+    import fcntl
+except ImportError:  # Windows: ingestion isn't serialized across processes
+    fcntl = None
+
+LEND_HISTORY_CSV = os.getenv("LEND_HISTORY_CSV", "library-book-lend-history.csv")
+LEND_STORE_DIR = os.getenv("LEND_STORE_DIR", "lend_history")
+
+# Layout of the store directory:
+#   manifest.json          {"version", "base", "segments"}, replaced atomically on every change
+#   base-NNNNNN/           the full history as of the last convert/compact
+#   segment-NNNNNN/        one appended batch of transactions each, in order
+# Every base/segment directory holds the same columns. Rows are sorted by card,
+# then by time, so the rows of the i-th card are rows card_offsets[i]:card_offsets[i + 1].
+#   columns.json           row count, card and transaction names
+#   card_codes.npy         int32, position of the row's card in columns["cards"]
+#   transaction_codes.npy  int16, position of the row's transaction in columns["transactions"]
+#   timestamps.npy         int64, nanoseconds since the epoch
+#   amounts.npy            float64, NaN when the amount isn't a number
+#   card_offsets.npy       int64, len(cards) + 1 row offsets
+#   lend_times.npy         int64, timestamps of the 'Check in' rows only (same order)
+#   lend_offsets.npy       int64, len(cards) + 1 offsets into lend_times
+ARRAYS = ("card_codes", "transaction_codes", "timestamps", "amounts",
+          "card_offsets", "lend_times", "lend_offsets")
+REQUIRED_COLUMNS = ("Date", "Card number", "Transaction", "Amount")
+
+LEND = "Check in"
+RETURN = "Check out"
+PAYMENT = "Payment"
+
+
+class LendStore:
+    """
+    The lend history as plain numpy columns, either in memory (see
+    from_frame) or memory-mapped from a store directory (see open_store),
+    in which case every worker process shares the same physical pages.
+    """
+
+    def __init__(self, cards, transactions, arrays, path=None):
+        self.cards = cards
+        self.transactions = transactions
+        self.path = path
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def transaction_code(self, name):
+        return self.transactions.index(name) if name in self.transactions else -1
+
+
+def _offsets(codes, size):
+    return np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=size)))).astype(np.int64)
+
+
+def from_frame(df):
+    """
+    Converts a lend history DataFrame (Date, Card number, Transaction, Amount
+    columns) into sorted columns, parsing every date once.
+    """
+    import pandas as pd
+
+    cards = pd.Categorical(df['Card number'].astype(str))
+    transactions = pd.Categorical(df['Transaction'].astype(str))
+    timestamps = pd.to_datetime(df['Date']).to_numpy(dtype='datetime64[ns]').view(np.int64)
+    try:
+        # astype parses like float(); to_numeric's faster parser can be one ulp off
+        amounts = df['Amount'].astype(np.float64).to_numpy()
+    except (ValueError, TypeError):
+        amounts = pd.to_numeric(df['Amount'], errors='coerce').to_numpy(dtype=np.float64)
+
+    card_codes = cards.codes.astype(np.int32)
+    order = np.lexsort((timestamps, card_codes))
+    return from_columns(list(cards.categories), list(transactions.categories), card_codes[order],
+                        transactions.codes.astype(np.int16)[order], timestamps[order], amounts[order])
+
+
+def from_columns(cards, transactions, card_codes, transaction_codes, timestamps, amounts):
+    """
+    Builds a store from columns that are already sorted by card code and time.
+    """
+    lend_code = transactions.index(LEND) if LEND in transactions else -1
+    is_lend = transaction_codes == lend_code
+    arrays = {
+        "card_codes": card_codes,
+        "transaction_codes": transaction_codes,
+        "timestamps": timestamps,
+        "amounts": amounts,
+        "card_offsets": _offsets(card_codes, len(cards)),
+        "lend_times": timestamps[is_lend],
+        "lend_offsets": _offsets(card_codes[is_lend], len(cards)),
+    }
+    return LendStore(cards, transactions, arrays)
+
+
+def concat_stores(stores):
+    """
+    Merges several stores (each with its own card/transaction names) into one
+    sorted in-memory store.
+    """
+    cards = sorted(set().union(*(store.cards for store in stores)))
+    transactions = sorted(set().union(*(store.transactions for store in stores)))
+    card_positions = {card: i for i, card in enumerate(cards)}
+    transaction_positions = {name: i for i, name in enumerate(transactions)}
+
+    card_codes = np.concatenate([
+        np.array([card_positions[c] for c in store.cards], dtype=np.int32)[np.asarray(store.card_codes)]
+        for store in stores
+    ])
+    transaction_codes = np.concatenate([
+        np.array([transaction_positions[t] for t in store.transactions], dtype=np.int16)[np.asarray(store.transaction_codes)]
+        for store in stores
+    ])
+    timestamps = np.concatenate([np.asarray(store.timestamps) for store in stores])
+    amounts = np.concatenate([np.asarray(store.amounts) for store in stores])
+
+    order = np.lexsort((timestamps, card_codes))
+    return from_columns(cards, transactions, card_codes[order], transaction_codes[order],
+                        timestamps[order], amounts[order])
+
+
+def _write_columns(store, path):
+    os.makedirs(path, exist_ok=True)
+    for name in ARRAYS:
+        np.save(os.path.join(path, f"{name}.npy"), getattr(store, name))
+    with open(os.path.join(path, "columns.json"), "w") as f:
+        json.dump({"rows": len(store), "cards": store.cards, "transactions": store.transactions}, f)
+
+
+def _open_columns(path):
+    with open(os.path.join(path, "columns.json")) as f:
+        columns = json.load(f)
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+    return LendStore(columns["cards"], columns["transactions"], arrays, path=path)
+
+
+def _write_manifest(path, manifest):
+    manifest["updated"] = datetime.datetime.utcnow().isoformat()
+    tmp_path = os.path.join(path, "manifest.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(path, "manifest.json"))
+
+
+def read_manifest(path=LEND_STORE_DIR):
+    with open(os.path.join(path, "manifest.json")) as f:
+        return json.load(f)
+
+
+def manifest_state(path=LEND_STORE_DIR):
+    """
+    Cheap change check for workers: the manifest is replaced on every write.
+    None when there is no store.
+    """
+    try:
+        stat = os.stat(os.path.join(path, "manifest.json"))
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+@contextmanager
+def _store_lock(path):
+    # serializes writers (ingest, compact, convert) across processes
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, ".lock"), "w") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _remove_unreferenced(path, manifest):
+    # running workers keep their memory maps of removed files until they reload
+    keep = {manifest["base"], *manifest["segments"]}
+    for name in os.listdir(path):
+        if name.startswith(("base-", "segment-")) and name not in keep:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+def write_store(store, path=LEND_STORE_DIR):
+    """
+    Writes store as the new base of the store directory, dropping any
+    appended segments. The manifest is switched last, so readers never see a
+    half written store.
+    """
+    with _store_lock(path):
+        version = read_manifest(path)["version"] + 1 if store_exists(path) else 1
+        base = f"base-{version:06d}"
+        _write_columns(store, os.path.join(path, base))
+        manifest = {"version": version, "base": base, "segments": []}
+        _write_manifest(path, manifest)
+        _remove_unreferenced(path, manifest)
+
+
+def store_exists(path=LEND_STORE_DIR):
+    return os.path.exists(os.path.join(path, "manifest.json"))
+
+
+def open_store(path=LEND_STORE_DIR, manifest=None):
+    """
+    Memory-maps the base of a store directory. Nothing is read until used.
+    """
+    manifest = manifest or read_manifest(path)
+    return _open_columns(os.path.join(path, manifest["base"]))
+
+
+def open_segments(names, path=LEND_STORE_DIR):
+    return [_open_columns(os.path.join(path, name)) for name in names]
+
+
+def load_store(path=LEND_STORE_DIR, csv_path=LEND_HISTORY_CSV):
+    """
+    Opens the memory-mapped store (base and appended segments), or falls back
+    to parsing the CSV when it hasn't been converted yet.
+    """
+    if store_exists(path):
+        manifest = read_manifest(path)
+        base = open_store(path, manifest)
+        if not manifest["segments"]:
+            return base
+        return concat_stores([base] + open_segments(manifest["segments"], path))
+
+    import pandas as pd
+    print(f"[-] No lend store at {path}, reading {csv_path} (run `python lendstore.py convert`)")
+    return from_frame(pd.read_csv(csv_path))
+
+
+def read_batch(source, data_format="csv"):
+    """
+    Reads a batch of new transactions (CSV, or NDJSON with one object per
+    line) with the same columns as the lend history CSV.
+    """
+    import pandas as pd
+
+    if data_format == "ndjson":
+        df = pd.read_json(source, lines=True, dtype={"Card number": str, "Amount": str})
+    else:
+        df = pd.read_csv(source, dtype={"Card number": str})
+    missing = [column for column in REQUIRED_COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    return df
+
+
+def ingest_frame(df, path=LEND_STORE_DIR):
+    """
+    Appends a batch of transactions to the store as a new segment. Workers
+    pick it up on their next lookup and only update the affected cards.
+
+    Returns:
+        Dict with the segment name, row count and number of affected cards.
+    """
+    if not store_exists(path):
+        raise ValueError(f"No lend store at {path}, run `python lendstore.py convert` first")
+    if df.empty:
+        raise ValueError("The batch has no rows")
+
+    segment = from_frame(df)
+    with _store_lock(path):
+        manifest = read_manifest(path)
+        version = manifest["version"] + 1
+        name = f"segment-{version:06d}"
+        _write_columns(segment, os.path.join(path, name))
+        _write_manifest(path, {"version": version, "base": manifest["base"],
+                               "segments": manifest["segments"] + [name]})
+    return {"segment": name, "rows": len(segment), "cards": len(segment.cards)}
+
+
+def compact(path=LEND_STORE_DIR):
+    """
+    Folds the appended segments into a new base so workers start from a
+    single memory-mapped base again.
+    """
+    with _store_lock(path):
+        manifest = read_manifest(path)
+        if not manifest["segments"]:
+            return manifest["base"]
+        merged = concat_stores([open_store(path, manifest)] + open_segments(manifest["segments"], path))
+        version = manifest["version"] + 1
+        base = f"base-{version:06d}"
+        _write_columns(merged, os.path.join(path, base))
+        new_manifest = {"version": version, "base": base, "segments": []}
+        _write_manifest(path, new_manifest)
+        _remove_unreferenced(path, new_manifest)
+    return base
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Columnar store for the library lend history")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="build the store from the lend history CSV")
+    convert_parser.add_argument("--csv", default=LEND_HISTORY_CSV)
+    ingest_parser = subparsers.add_parser("ingest", help="append a batch of new transactions")
+    ingest_parser.add_argument("file", help="CSV or NDJSON (.ndjson/.jsonl) file")
+    subparsers.add_parser("compact", help="fold the appended batches into the base")
+    parser.add_argument("--store", default=LEND_STORE_DIR)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "convert":
+        import pandas as pd
+
+        store = from_frame(pd.read_csv(args.csv))
+        write_store(store, args.store)
+        print(f"Wrote {len(store)} rows for {len(store.cards)} cards to {args.store}")
+    elif args.command == "ingest":
+        data_format = "ndjson" if args.file.endswith((".ndjson", ".jsonl")) else "csv"
+        result = ingest_frame(read_batch(args.file, data_format), args.store)
+        print(f"Appended {result['rows']} rows for {result['cards']} cards as {result['segment']}")
+    else:
+        print(f"Compacted the store into {compact(args.store)}")
+    print(f"Done in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,200 @@
+# mailer.py - persistent email outbox drained by a background worker
+import os
+import smtplib
+import threading
+import logging
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from dotenv import load_dotenv
+from pymongo import ReturnDocument
+
+from database import outbox_collection
+import metrics
+
+load_dotenv()
+
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_USER = os.getenv("GMAIL_ID")
+SMTP_PASSWORD = os.getenv("GMAIL_PASSWORD")
+
+MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", 5))
+BACKOFF_SECONDS = int(os.getenv("MAIL_BACKOFF_SECONDS", 30))
+POLL_SECONDS = 5
+IDLE_DISCONNECT_SECONDS = 60  # close the SMTP session after this long without mail
+STALE_SENDING_SECONDS = 600   # reclaim messages left in SENDING by a crashed worker
+
+_wakeup = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def enqueue_mail(receiver_email, subject, html_content, key=None):
+    """
+    Stores a message in the outbox and returns immediately. The background
+    worker delivers it. A message given a key is stored under that _id only
+    once, so enqueueing it again (e.g. from a retried job) sends no copy.
+
+    Returns:
+        _id of the outbox document (an ObjectId unless a key was given).
+    """
+    now = datetime.utcnow()
+    mail = {
+        "to": receiver_email,
+        "subject": subject,
+        "html": html_content,
+        "status": "QUEUED",
+        "attempts": 0,
+        "created": now,
+        "next_attempt": now,
+        "sent_date": None,
+        "last_error": None
+    }
+    if key is None:
+        mail_id = outbox_collection.insert_one(mail).inserted_id
+    else:
+        outbox_collection.update_one({"_id": key}, {"$setOnInsert": mail}, upsert=True)
+        mail_id = key
+    _wakeup.set()
+    return mail_id
+
+
+def _build_message(mail):
+    msg = MIMEMultipart("alternative")
+    msg['Subject'] = mail["subject"]
+    msg['From'] = SMTP_USER
+    msg['To'] = mail["to"]
+    msg.attach(MIMEText(mail["html"], "html"))
+    return msg
+
+
+class OutboxWorker(threading.Thread):
+    """
+    Claims due messages from the outbox one at a time and sends them over a
+    single authenticated SMTP session, which is kept open between messages
+    and re-opened when the server drops it. Failed sends are retried with
+    exponential backoff until MAX_ATTEMPTS, after which they are marked FAILED.
+    """
+
+    def __init__(self):
+        super().__init__(name="outbox-worker", daemon=True)
+        self._server = None
+        self._last_used = None
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        _wakeup.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                mail = self._claim_next()
+            except Exception as e:
+                logging.error(f"Outbox claim failed: {str(e)}")
+                mail = None
+
+            if mail is None:
+                self._close_if_idle()
+                _wakeup.wait(POLL_SECONDS)
+                _wakeup.clear()
+                continue
+
+            self._deliver(mail)
+        self._disconnect()
+
+    def _claim_next(self):
+        now = datetime.utcnow()
+        return outbox_collection.find_one_and_update(
+            {"$or": [
+                {"status": "QUEUED", "next_attempt": {"$lte": now}},
+                {"status": "SENDING", "claimed_date": {"$lte": now - timedelta(seconds=STALE_SENDING_SECONDS)}}
+            ]},
+            {"$set": {"status": "SENDING", "claimed_date": now}},
+            sort=[("next_attempt", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _deliver(self, mail):
+        try:
+            self._send(_build_message(mail))
+        except Exception as e:
+            attempts = mail.get("attempts", 0) + 1
+            failed = attempts >= MAX_ATTEMPTS
+            outbox_collection.update_one({"_id": mail["_id"]}, {"$set": {
+                "status": "FAILED" if failed else "QUEUED",
+                "attempts": attempts,
+                "next_attempt": datetime.utcnow() + timedelta(seconds=BACKOFF_SECONDS * 2 ** (attempts - 1)),
+                "last_error": str(e)
+            }})
+            logging.error(f"Mail to {mail['to']} failed (attempt {attempts}): {str(e)}")
+            return
+
+        outbox_collection.update_one({"_id": mail["_id"]}, {"$set": {
+            "status": "SENT",
+            "attempts": mail.get("attempts", 0) + 1,
+            "sent_date": datetime.utcnow(),
+            "last_error": None
+        }})
+
+    def _send(self, msg):
+        with metrics.span("smtp.send"):
+            try:
+                self._connect().sendmail(SMTP_USER, msg['To'], msg.as_string())
+            except smtplib.SMTPServerDisconnected:
+                # the pooled session timed out on the server side, retry once on a fresh one
+                self._disconnect()
+                self._connect().sendmail(SMTP_USER, msg['To'], msg.as_string())
+        self._last_used = datetime.utcnow()
+
+    def _connect(self):
+        if self._server is None:
+            server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+            if SMTP_STARTTLS:
+                server.starttls()
+            if SMTP_USER and SMTP_PASSWORD:
+                server.login(SMTP_USER, SMTP_PASSWORD)
+            self._server = server
+        return self._server
+
+    def _disconnect(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+    def _close_if_idle(self):
+        if self._server is not None and self._last_used and \
+                datetime.utcnow() - self._last_used > timedelta(seconds=IDLE_DISCONNECT_SECONDS):
+            self._disconnect()
+
+
+def start_worker():
+    """
+    Starts the outbox worker for this process (once).
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = OutboxWorker()
+            _worker.start()
+    return _worker
+
+
+def stop_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is not None:
+            _worker.stop()
+            _worker.join(timeout=10)
+            _worker = None
+
+
+def outbox_status():
+    # count of outbox messages per delivery status
+    counts = outbox_collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}])
+    return {str(c["_id"]): c["count"] for c in counts}
@@ -0,0 +1,97 @@
+# memory.py - per-process memory figures (RSS, PSS, shared pages) from /proc (Linux only)
+import os
+
+FIELDS = ["Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty", "Swap"]
+
+
+def _read_smaps(path, files=()):
+    # sums the kB fields of every mapping, and separately of the mappings of each file
+    totals = dict.fromkeys(FIELDS, 0)
+    mapped = {name: dict.fromkeys(FIELDS, 0) for name in files}
+    current = None
+    with open(path) as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key not in FIELDS:
+                # a mapping header: "7f...-7f... r--p 00000000 08:01 1234   /path/to/file"
+                parts = line.split(None, 5)
+                if len(parts) >= 5 and "-" in parts[0]:
+                    name = parts[5].strip() if len(parts) == 6 else ""
+                    current = mapped.get(os.path.realpath(name)) if name.startswith("/") else None
+                continue
+            kb = int(rest.split()[0])
+            totals[key] += kb
+            if current is not None:
+                current[key] += kb
+    return totals, mapped
+
+
+def _mb(fields):
+    return {key.lower(): round(kb / 1024, 1) for key, kb in fields.items()}
+
+
+def process_memory(pid="self", files=()):
+    """
+    Memory of one process in MB. Pss splits every shared page between the
+    processes mapping it, so the Pss of all workers adds up to their real
+    footprint, while their Rss counts shared pages once per worker.
+
+    Returns:
+        Dict with the pid, the process totals and, for each of the given
+        files, the part of the totals that comes from mapping that file.
+    """
+    files = [os.path.realpath(name) for name in files]
+    # smaps_rollup is much cheaper to read when no per-file figures are needed
+    totals, mapped = _read_smaps(f"/proc/{pid}/{'smaps' if files else 'smaps_rollup'}", files)
+    return {
+        "pid": os.getpid() if pid == "self" else int(pid),
+        "total": _mb(totals),
+        "mapped_files": {name: _mb(fields) for name, fields in mapped.items()}
+    }
+
+
+def worker_pids(master_pid):
+    # the direct children of a gunicorn master
+    children = set()
+    for task in os.listdir(f"/proc/{master_pid}/task"):
+        with open(f"/proc/{master_pid}/task/{task}/children") as f:
+            children.update(int(pid) for pid in f.read().split())
+    return sorted(children)
+
+
+def report(pids, files=()):
+    """
+    Memory of every given process, plus the sums over all of them.
+    """
+    processes = [process_memory(pid, files) for pid in pids]
+    return {
+        "processes": processes,
+        "rss_sum": round(sum(p["total"]["rss"] for p in processes), 1),
+        "pss_sum": round(sum(p["total"]["pss"] for p in processes), 1)
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Memory of the app's worker processes")
+    parser.add_argument("pids", nargs="*", type=int, help="processes to report on")
+    parser.add_argument("--master", type=int, help="report on every worker of this gunicorn master")
+    parser.add_argument("--file", action="append", default=[], help="also show the memory mapped from this file")
+    args = parser.parse_args()
+
+    pids = args.pids + (worker_pids(args.master) if args.master else [])
+    if not pids:
+        parser.error("give worker pids or --master")
+    result = report(pids, args.file)
+    print(f"{'pid':>8} {'rss MB':>8} {'pss MB':>8} {'shared':>8} {'private':>8}" +
+          "".join(f" {os.path.basename(name)[:14] + ' pss':>19}" for name in args.file))
+    for process in result["processes"]:
+        total = process["total"]
+        shared = total["shared_clean"] + total["shared_dirty"]
+        private = total["private_clean"] + total["private_dirty"]
+        row = f"{process['pid']:>8} {total['rss']:8.1f} {total['pss']:8.1f} {shared:8.1f} {private:8.1f}"
+        for fields in process["mapped_files"].values():
+            row += f" {fields['pss']:8.1f} of {fields['rss']:6.1f} rss"
+        print(row)
+    print(f"{'sum':>8} {result['rss_sum']:8.1f} {result['pss_sum']:8.1f}")
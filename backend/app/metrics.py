@@ -0,0 +1,335 @@
+# metrics.py - request latency histograms, named spans and a Prometheus /metrics page
+import os
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from flask import g, request, has_request_context
+from pymongo import monitoring
+
+# log requests slower than this (ms) with their span breakdown, 0 to disable
+SLOW_REQUEST_MS = int(os.getenv("SLOW_REQUEST_MS", 0))
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram per label set, in the Prometheus layout.
+    """
+
+    def __init__(self, name, help_text, label_names, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, seconds):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect.bisect_left(self.buckets, seconds)] += 1
+            series[-1] += seconds
+
+    def snapshot(self):
+        # labels -> copy of [bucket counts..., +Inf count, sum]
+        with self._lock:
+            return {labels: list(values) for labels, values in self._series.items()}
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, values in sorted(self.snapshot().items()):
+            base = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{{{base}{',' if base else ''}le=\"{bound}\"}} {cumulative}")
+            lines.append(f"{self.name}_sum{{{base}}} {values[-1]}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.snapshot().items()):
+            lines.append(f"{self.name}{{{_labels(self.label_names, labels)}}} {value}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+            return self._values[labels]
+
+    def dec(self, labels, amount=1):
+        return self.inc(labels, -amount)
+
+    def get(self, labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self.snapshot().items()):
+            lines.append(f"{self.name}{{{_labels(self.label_names, labels)}}} {value}")
+        return lines
+
+
+def _labels(names, values):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return ",".join(f"{name}=\"{escape(value)}\"" for name, value in zip(names, values))
+
+
+request_duration = Histogram("http_request_duration_seconds", "Request latency per route.", ("method", "route"))
+request_count = Counter("http_requests_total", "Requests per route and status code.", ("method", "route", "status"))
+span_duration = Histogram("span_duration_seconds", "Duration of named steps inside requests and workers.", ("span",))
+
+# Mongo connection pool, per server address (see MongoPoolMonitor)
+POOL_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+pool_checkout_duration = Histogram("mongo_pool_checkout_seconds",
+                                   "Time a thread waited for a pooled Mongo connection.", ("address",), POOL_BUCKETS)
+pool_checkout_failures = Counter("mongo_pool_checkout_failures_total",
+                                 "Failed connection checkouts per reason.", ("address", "reason"))
+pool_connections = Gauge("mongo_pool_connections",
+                         "Pooled Mongo connections that are open, in use, or being waited for.", ("address", "state"))
+
+METRICS = [request_duration, request_count, span_duration,
+           pool_checkout_duration, pool_checkout_failures, pool_connections]
+
+
+def record_span(name, seconds):
+    span_duration.observe((name,), seconds)
+    # keep the breakdown of the current request for the slow request log
+    if has_request_context() and "spans" in g:
+        g.spans.append((name, seconds))
+
+
+@contextmanager
+def span(name):
+    """
+    Times the enclosed block as a named span:
+
+        with metrics.span("classify_feedback"):
+            ...
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """
+    Records every Mongo command as a "mongo.<command>" span. pymongo calls
+    the listener on the thread that ran the command, so the spans land in
+    the request that issued them.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        record_span(f"mongo.{event.command_name}", event.duration_micros / 1e6)
+
+    def failed(self, event):
+        record_span(f"mongo.{event.command_name}", event.duration_micros / 1e6)
+
+
+class MongoPoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Tracks every connection pool: open and checked out connections, threads
+    waiting for a connection (and the most that ever waited at once), and
+    how long each checkout took. A long checkout means the pool was empty
+    and the request queued for MONGO_MAX_POOL_SIZE.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._max_waiting = {}
+
+    @staticmethod
+    def _address(event):
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pool_connections.inc((self._address(event), "open"))
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pool_connections.dec((self._address(event), "open"))
+
+    def connection_check_out_started(self, event):
+        # started and finished events of one checkout arrive on the same thread
+        self._local.started = time.perf_counter()
+        address = self._address(event)
+        waiting = pool_connections.inc((address, "waiting"))
+        with self._lock:
+            self._max_waiting[address] = max(self._max_waiting.get(address, 0), waiting)
+
+    def _checkout_done(self, event):
+        address = self._address(event)
+        pool_connections.dec((address, "waiting"))
+        started = getattr(self._local, "started", None)
+        if started is not None:
+            pool_checkout_duration.observe((address,), time.perf_counter() - started)
+            self._local.started = None
+        return address
+
+    def connection_checked_out(self, event):
+        pool_connections.inc((self._checkout_done(event), "in_use"))
+
+    def connection_check_out_failed(self, event):
+        pool_checkout_failures.inc((self._checkout_done(event), str(event.reason)))
+
+    def connection_checked_in(self, event):
+        pool_connections.dec((self._address(event), "in_use"))
+
+    def reset(self):
+        # drops the pool figures inherited from the parent process after fork
+        pool_connections.clear()
+        pool_checkout_duration.clear()
+        pool_checkout_failures.clear()
+        with self._lock:
+            self._max_waiting.clear()
+
+    def stats(self):
+        """
+        Returns:
+            Dict of server address -> open / in use / waiting connections,
+            the most threads that waited at once, checkout count, failures
+            and mean checkout time.
+        """
+        with self._lock:
+            max_waiting = dict(self._max_waiting)
+        checkouts = {labels[0]: (sum(values[:-1]), values[-1])
+                     for labels, values in pool_checkout_duration.snapshot().items()}
+        failures = pool_checkout_failures.snapshot()
+        connections = pool_connections.snapshot()
+
+        stats = {}
+        for address in sorted(set(max_waiting) | set(checkouts)):
+            count, seconds = checkouts.get(address, (0, 0.0))
+            stats[address] = {
+                "open": connections.get((address, "open"), 0),
+                "in_use": connections.get((address, "in_use"), 0),
+                "waiting": connections.get((address, "waiting"), 0),
+                "max_waiting": max_waiting.get(address, 0),
+                "checkouts": count,
+                "checkout_failures": {labels[1]: value for labels, value in failures.items() if labels[0] == address},
+                "mean_checkout_ms": round(1000 * seconds / count, 3) if count else 0
+            }
+        return stats
+
+
+pool_monitor = MongoPoolMonitor()
+
+
+def _route():
+    # the rule ("/users/feedback_status/<feedback_id>") keeps the label set small
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+def _before_request():
+    g.request_start = time.perf_counter()
+    g.spans = []
+
+
+def _after_request(response):
+    if "request_start" not in g:
+        return response
+    seconds = time.perf_counter() - g.request_start
+    route = _route()
+    request_duration.observe((request.method, route), seconds)
+    request_count.inc((request.method, route, str(response.status_code)))
+
+    if SLOW_REQUEST_MS and seconds * 1000 >= SLOW_REQUEST_MS:
+        totals = {}
+        for name, span_seconds in g.spans:
+            count, total = totals.get(name, (0, 0.0))
+            totals[name] = (count + 1, total + span_seconds)
+        breakdown = ", ".join(
+            f"{name} {total * 1000:.1f}ms" + (f" (x{count})" if count > 1 else "")
+            for name, (count, total) in sorted(totals.items(), key=lambda item: -item[1][1])
+        )
+        logging.warning(f"Slow request: {request.method} {route} {response.status_code} "
+                        f"{seconds * 1000:.1f}ms [{breakdown or 'no spans'}]")
+    return response
+
+
+def instrument(blueprint):
+    """
+    Adds the latency/status hooks to every route of the blueprint.
+    """
+    blueprint.before_request(_before_request)
+    blueprint.after_request(_after_request)
+    return blueprint
+
+
+def render():
+    # Prometheus text exposition format
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
@@ -1,102 +1,105 @@
 # import needed libraries
-import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
-from database import library_db
-import os
-import smtplib
+# (pandas, numpy and transformers are only imported on first use, see scoring.py and classifier.py)
+from datetime import datetime
 from dotenv import load_dotenv
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-import json
-import re
-from pathlib import Path
-from collections import defaultdict
+import classifier
+import scoring
+import mailer
+import categories
+import resultcache
+import metrics
 
 load_dotenv()
 
 print("pipeline imported")
 
 # function to score users
-def calculate_feedback_score(roll_number, df=library_db):
+def calculate_feedback_score(roll_number, df=None):
     """
-    Calculate feedback trust score (0-1) where:
-    - 'Check in' = Lending (user takes book)
-    - 'Check out' = Returning (user brings book back)
-    - Negative 'Amount' = Fine payment (e.g., -40.00 = ₹40 fine)
+    Calculate feedback trust score (0-1) from the per-card lending index
+    (see scoring.py). Pass df to score against a different lending history.
     """
     # Auto-accept faculty (cards starting with 'C')
     if str(roll_number).startswith('C'):
         return 1.0, 'high'
-    
-    df['Date'] = pd.to_datetime(df['Date'])
-    
-    student_data = df[df['Card number'] == roll_number]
-    if student_data.empty:
-        return 0.0, 'low'
-    
-    today = pd.Timestamp.now()
-    last_15_days = today - timedelta(days=15)
-    
-    # Calculate metrics
-    metrics = {
-        'recent_lends': len(student_data[(student_data['Date'] >= last_15_days) & 
-                                      (student_data['Transaction'] == 'Check in')]),
-        'total_lends': len(student_data[student_data['Transaction'] == 'Check in']),
-        'returns': len(student_data[student_data['Transaction'] == 'Check out']),
-        'avg_fine': abs(student_data[student_data['Transaction'] == 'Payment']['Amount']
-                       .astype(float).mean() or 0),
-        'days_inactive': (today - student_data['Date'].max()).days
-    }
-    
-    # Normalize scores (0-1 range)
-    scores = {
-        'activity': min(metrics['recent_lends'] / 4, 1.0),  # 4+ recent lends = 1.0
-        'engagement': min(metrics['total_lends'] / 10, 1.0), # 10+ total lends = 1.0
-        'responsibility': metrics['returns'] / metrics['total_lends'] if metrics['total_lends'] > 0 else 0,
-        'financial': max(0, 1 - metrics['avg_fine'] / 200), # ₹200 = 0 score
-        'recency': np.exp(-0.05 * metrics['days_inactive']) # 5% daily decay
-    }
-    
-    # Weighted average
-    weights = {
-        'activity': 0.10,  # Recent usage
-        'engagement': 0.50, # Historical usage
-        'responsibility': 0.20, # Return behavior
-        'financial': 0.10, # Fine payments
-        'recency': 0.10     # Account activity
-    }
-    
-    final_score = sum(scores[k] * weights[k] for k in weights)
-    
-    # Priority tiers
-    if final_score >= 0.7:
-        return round(final_score, 2), 'high'
-    elif final_score >= 0.4:
-        return round(final_score, 2), 'medium'
-    else:
-        return round(final_score, 2), 'low'
+
+    with metrics.span("calculate_feedback_score"):
+        index = scoring.get_card_index() if df is None else scoring.build_card_index(df)
+        return scoring.score_card(index, roll_number)
+
+# function to rescore every student in the lending history at once
+def rescore_all_users(df=None, now=None):
+    """
+    Computes activity/engagement/responsibility/financial/recency scores and
+    the priority tier for every card in the lending history in one pass.
+
+    Returns:
+        DataFrame indexed by card number (see scoring.score_all).
+    """
+    index = scoring.get_card_index() if df is None else scoring.build_card_index(df)
+    return scoring.score_all(index, now)
+
+
+def save_user_scores(scores, batch_size=1000):
+    """
+    Writes the rescored cards back to the users collection and refreshes
+    user_score on the open issues raised by those users, using bulk writes.
+
+    Returns:
+        Tuple[int, int]: Number of modified users and issues.
+    """
+    from pymongo import UpdateOne, UpdateMany
+    from database import users_collection, issues_collection
+
+    updated_at = datetime.utcnow()
+    breakdown_cols = list(scoring.WEIGHTS)
+    user_ops, issue_ops = [], []
+    modified_users = modified_issues = 0
+
+    for card, row in zip(scores.index, scores.itertuples(index=False)):
+        row = row._asdict()
+        score = float(row['score'])
+        user_ops.append(UpdateOne(
+            {"roll_no": card.lower(), "role": "user"},
+            {"$set": {
+                "trust_score": score,
+                "priority": row['priority'],
+                "score_breakdown": {k: round(float(row[k]), 4) for k in breakdown_cols},
+                "score_updated": updated_at
+            }}
+        ))
+        # staff issues keep their fixed score of 1.0 (see users.submit_feedback)
+        if card[0].isdigit():
+            issue_ops.append(UpdateMany(
+                {"raised_by": f"{card.lower()}@psgtech.ac.in", "status": {"$ne": "RESOLVED"}},
+                {"$set": {"user_score": score}}
+            ))
+
+        if len(user_ops) >= batch_size:
+            modified_users += users_collection.bulk_write(user_ops, ordered=False).modified_count
+            user_ops = []
+        if len(issue_ops) >= batch_size:
+            modified_issues += issues_collection.bulk_write(issue_ops, ordered=False).modified_count
+            issue_ops = []
+
+    if user_ops:
+        modified_users += users_collection.bulk_write(user_ops, ordered=False).modified_count
+    if issue_ops:
+        modified_issues += issues_collection.bulk_write(issue_ops, ordered=False).modified_count
+
+    return modified_users, modified_issues
 
 '''score, priority = calculate_feedback_score("23N201", library_db)
 print(f"Score: {score}/1.0 ({priority.upper()} priority)")
 '''
 
 
-def classify_feedback(text):
-    from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
-    # Load locally saved model and tokenizer
-    model_path = "local_model"
-    _classifier = pipeline(
-        "text-classification",
-        model=AutoModelForSequenceClassification.from_pretrained(model_path),
-        tokenizer=AutoTokenizer.from_pretrained(model_path),
-        top_k=None
-    )
+_issue_keywords = {
+    'problem', 'issue', 'error', 'fix', 'broken',
+    'not working', 'improve', 'complaint', 'fail'
+}
 
-    _issue_keywords = {
-        'problem', 'issue', 'error', 'fix', 'broken',
-        'not working', 'improve', 'complaint', 'fail'
-    }
+def classify_feedback(text):
     """
     Classifies the input feedback text into ISSUE, COMPLIMENT, or NEUTRAL.
     
@@ -106,7 +109,9 @@ def classify_feedback(text):
     Returns:
         Tuple[str, float]: Classification label and confidence score.
     """
-    result = _classifier(text)[0]
+    # the model is loaded once per process and concurrent texts are batched (see classifier.py)
+    with metrics.span("classify_feedback"):
+        result = classifier.predict(text)
     sentiment = max(result, key=lambda x: x['score'])
 
     text_lower = text.lower()
@@ -197,48 +202,41 @@ def get_feedback_email_template(user_name="User"):
     """
 
 # function to send mail to users regarding issue raise
-def send_tks_mail(receiver_email, user_name):
-    msg = MIMEMultipart("alternative")
-    msg['Subject'] = "Thank You for Your Feedback – GRD Library"
-    msg['From'] = os.getenv("GMAIL_ID")
-    msg['To'] = receiver_email
-    html_content = get_feedback_email_template(user_name)
-    mime_html = MIMEText(html_content, "html")
-    msg.attach(mime_html)
-    with smtplib.SMTP("smtp.gmail.com", 587) as server:
-        server.starttls()
-        server.login(os.getenv("GMAIL_ID"), os.getenv("GMAIL_PASSWORD"))
-        server.sendmail(os.getenv("GMAIL_ID"), receiver_email, msg.as_string())
-
-def classify_issues(issue, config_file="dataset/categories.json"):
+def send_tks_mail(receiver_email, user_name, key=None):
+    # queued in the outbox and delivered by the background worker (see mailer.py)
+    return mailer.enqueue_mail(
+        receiver_email,
+        "Thank You for Your Feedback – GRD Library",
+        get_feedback_email_template(user_name),
+        key=key
+    )
+
+def classify_issues(issue, config_file=categories.DEFAULT_CONFIG):
     """
     Classifies a single issue string into one or more categories based on keywords.
     Returns the best-matched category or 'Other Issues'.
     """
-    # Load category configuration
-    try:
-        with open(config_file) as f:
-            config = json.load(f)
-        categories = config["categories"]
-        misc_cat = config["misc_category"]
-    except Exception as e:
-        raise ValueError(f"Error loading {config_file}: {str(e)}")
-
-    # Prepare category match dictionary
-    match_scores = defaultdict(int)
-    issue_lower = issue.lower()
-
-    for cat in categories:
-        for kw in cat["keywords"]:
-            if kw.lower() in issue_lower:
-                match_scores[cat["name"]] += 1
-
-    if not match_scores:
-        return misc_cat["name"]
-
-    # Select the category with the highest match count
-    best_category = max(match_scores.items(), key=lambda x: x[1])[0]
-    return best_category
+    # the config is cached and compiled into one regex (see categories.py)
+    with metrics.span("classify_issues"):
+        return categories.get_engine(config_file).classify(issue)
+
+
+def _classify_answer(text):
+    label, confidence = classify_feedback(text)
+    category = classify_issues(text) if label == 'ISSUE' else None
+    return label, confidence, category
+
+
+def classify_answer(text):
+    """
+    Classifies a feedback answer and, when it is an issue, its category.
+    Repeated answers ("nothing", "good", "wifi is slow") are answered from
+    the result cache without running the model (see resultcache.py).
+
+    Returns:
+        Tuple[str, float, str]: Label, confidence and category (None unless ISSUE).
+    """
+    return resultcache.result_cache.get_or_classify(text, _classify_answer)
 
 def get_suspend_email_template(user_name="User"):
     return f"""
@@ -416,30 +414,37 @@ def get_pending_email_template(user_name="User"):
 
 
 def issue_close_mail(task, receiver_email, user_name):
-    msg = MIMEMultipart("alternative")
-    msg['From'] = os.getenv("GMAIL_ID")
-    msg['To'] = receiver_email
-
     if task == "RESOLVED":
-        msg['Subject'] = "Your Issue Has Been Resolved"
+        subject = "Your Issue Has Been Resolved"
         html_content = get_resolved_email_template(user_name)
     elif task == "SUSPENDED":
-        msg['Subject'] = "Your Issue Has Been Suspended"
+        subject = "Your Issue Has Been Suspended"
         html_content = get_suspend_email_template(user_name)
     elif task == "PENDING":
-        msg['Subject'] = "Your Issue Is Pending"
+        subject = "Your Issue Is Pending"
         html_content = get_pending_email_template(user_name)
     else:
         return  # Invalid task
 
-    mime_html = MIMEText(html_content, "html")
-    msg.attach(mime_html)
-
-    with smtplib.SMTP("smtp.gmail.com", 587) as server:
-        server.starttls()
-        server.login(os.getenv("GMAIL_ID"), os.getenv("GMAIL_PASSWORD"))
-        server.sendmail(os.getenv("GMAIL_ID"), receiver_email, msg.as_string())
+    return mailer.enqueue_mail(receiver_email, subject, html_content)
 
 
+if __name__ == "__main__":
+    import argparse
 
+    parser = argparse.ArgumentParser(description="Rescore students from the lending history")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rescore_parser = subparsers.add_parser("rescore", help="rescore every student in the lending history")
+    rescore_parser.add_argument("--dry-run", action="store_true", help="print the scores without writing them")
+    args = parser.parse_args()
 
+    if args.command == "rescore":
+        start = datetime.now()
+        scores = rescore_all_users()
+        print(f"Scored {len(scores)} cards in {(datetime.now() - start).total_seconds():.2f}s")
+        print(scores['priority'].value_counts().to_string())
+        if args.dry_run:
+            print(scores.sort_values('score', ascending=False).head(20).to_string())
+        else:
+            users, issues = save_user_scores(scores)
+            print(f"Updated {users} users and {issues} open issues")
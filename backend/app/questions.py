@@ -0,0 +1,108 @@
+# questions.py - the feedback form questions, cached per process and versioned in Mongo
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import namedtuple
+from flask import Response
+
+from database import questions_collection
+from database import versions_collection
+
+# how often a worker checks the version counter for question changes made by other workers
+VERSION_CHECK_SECONDS = float(os.getenv("QUESTIONS_VERSION_CHECK_SECONDS", 5))
+# how long browsers may use their copy without asking (0: revalidate every time, answered by a 304)
+QUESTIONS_MAX_AGE = int(os.getenv("QUESTIONS_MAX_AGE", 0))
+VERSION_ID = "questions"
+
+CachedQuestions = namedtuple("CachedQuestions", ["version", "body", "etag"])
+
+
+def load_questions():
+    questions = questions_collection.find({}, {"_id": 1, "question": 1, "options": 1})
+    feedback_questions = []
+    for question in questions:
+        if "question" in question and "options" in question:
+            feedback_questions.append({
+                "id": str(question["_id"]),
+                "question": question["question"],
+                "options": question["options"]
+            })
+        else:
+            print(f"Missing keys in question document: {question}")
+    return feedback_questions
+
+
+class QuestionCache:
+    """
+    The serialized question list and its ETag. Admin writes bump a version
+    counter in Mongo (see invalidate); each process reads that counter at
+    most every check_seconds and reloads the questions only when it moved,
+    so serving the form costs no database reads in between.
+    """
+
+    def __init__(self, check_seconds=VERSION_CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self._entry = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _fresh(self):
+        return self._entry is not None and time.monotonic() - self._checked < self.check_seconds
+
+    def get(self):
+        """
+        Returns:
+            CachedQuestions with the JSON body and its strong ETag.
+        """
+        if self._fresh():
+            return self._entry
+        with self._lock:
+            if not self._fresh():
+                document = versions_collection.find_one({"_id": VERSION_ID})
+                version = document["version"] if document else 0
+                if self._entry is None or self._entry.version != version:
+                    body = json.dumps(load_questions(), separators=(",", ":")).encode()
+                    # derived from the content, so every worker sends the same ETag for the same list
+                    self._entry = CachedQuestions(version, body, hashlib.sha1(body).hexdigest()[:20])
+                self._checked = time.monotonic()
+            return self._entry
+
+    def clear(self):
+        with self._lock:
+            self._entry = None
+
+
+question_cache = QuestionCache()
+
+
+def invalidate():
+    # called after every question write: this process reloads right away, the others within VERSION_CHECK_SECONDS
+    versions_collection.update_one({"_id": VERSION_ID}, {"$inc": {"version": 1}}, upsert=True)
+    question_cache.clear()
+
+
+def questions_response(request, private=False):
+    """
+    The question list with Cache-Control and a strong ETag, or an empty
+    304 when the request's If-None-Match already has it.
+    """
+    entry = question_cache.get()
+    response = Response(entry.body, mimetype="application/json")
+    response.set_etag(entry.etag)
+    if private:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    if QUESTIONS_MAX_AGE:
+        response.cache_control.max_age = QUESTIONS_MAX_AGE
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+if __name__ == "__main__":
+    # after editing the questions collection by hand: make every worker reload it
+    invalidate()
+    print("Feedback questions version bumped")
@@ -0,0 +1,110 @@
+# resultcache.py - cached sentiment labels and issue categories of feedback answers
+import os
+import hashlib
+import logging
+import threading
+import datetime
+
+from database import classification_cache_collection
+from cache import LRUCache
+import classifier
+import categories
+
+CLASSIFICATION_CACHE_SIZE = int(os.getenv("CLASSIFICATION_CACHE_SIZE", 10000))
+# also keep results in Mongo, so they survive restarts and are shared between workers
+CLASSIFICATION_CACHE_MONGO = os.getenv("CLASSIFICATION_CACHE_MONGO", "false").lower() == "true"
+# Mongo removes persisted results this long after they were stored (TTL index, see indexes.py)
+CLASSIFICATION_CACHE_TTL_DAYS = int(os.getenv("CLASSIFICATION_CACHE_TTL_DAYS", 30))
+
+
+def normalize(text):
+    # the model is uncased and the category keywords match case-insensitively
+    # across any whitespace, so neither result depends on case or spacing
+    return " ".join(str(text).lower().split())
+
+
+class ClassificationCache:
+    """
+    LRU cache of (label, confidence, category) per normalized answer, keyed
+    on a hash of the text together with the model and categories.json
+    versions. When either version changes the cache is cleared, so results
+    never outlive their model. Mongo documents of older versions are never
+    looked up again and expire with the TTL index; they aren't deleted
+    here, since during a rollout other workers still use their version.
+    """
+
+    def __init__(self, maxsize=CLASSIFICATION_CACHE_SIZE, collection=None):
+        self.results = LRUCache(maxsize)
+        self.collection = collection
+        self.versions = None
+        self.mongo_hits = 0
+        self._lock = threading.Lock()
+
+    def _current_versions(self, config_file):
+        versions = (classifier.model_version(), categories.get_engine(config_file).current_version())
+        if versions != self.versions:
+            with self._lock:
+                if versions != self.versions:
+                    self._invalidate(versions)
+        return versions
+
+    def _invalidate(self, versions):
+        if self.versions is not None:
+            logging.info("Model or categories changed, clearing the classification cache")
+        self.results.invalidate()
+        self.versions = versions
+
+    def get_or_classify(self, text, classify, config_file=categories.DEFAULT_CONFIG):
+        """
+        Returns the cached (label, confidence, category) of text, or calls
+        classify(text) and caches its result.
+        """
+        model_version, categories_version = self._current_versions(config_file)
+        key = hashlib.sha1(f"{model_version}:{categories_version}:{normalize(text)}".encode()).hexdigest()
+
+        result = self.results.get(key)
+        if result is not None:
+            return result
+
+        if self.collection is not None:
+            try:
+                doc = self.collection.find_one({"_id": key})
+            except Exception as e:
+                logging.error(f"Classification cache lookup failed: {str(e)}")
+                doc = None
+            if doc is not None:
+                self.mongo_hits += 1
+                return self.results.set(key, (doc["label"], doc["confidence"], doc["category"]))
+
+        result = self.results.set(key, classify(text))
+        if self.collection is not None:
+            label, confidence, category = result
+            try:
+                self.collection.update_one({"_id": key}, {"$set": {
+                    "label": label,
+                    "confidence": confidence,
+                    "category": category,
+                    "model_version": model_version,
+                    "categories_version": categories_version,
+                    "created": datetime.datetime.utcnow()
+                }}, upsert=True)
+            except Exception as e:
+                logging.error(f"Could not persist classification result: {str(e)}")
+        return result
+
+    def stats(self):
+        stats = self.results.stats()
+        # an in-process miss answered from Mongo still skipped inference
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "mongo": self.collection is not None,
+            "mongo_hits": self.mongo_hits,
+            "inferences": stats["misses"] - self.mongo_hits,
+            "hit_rate": (stats["hits"] + self.mongo_hits) / lookups if lookups else 0,
+            "model_version": self.versions[0] if self.versions else None,
+            "categories_version": self.versions[1] if self.versions else None
+        })
+        return stats
+
+
+result_cache = ClassificationCache(collection=classification_cache_collection if CLASSIFICATION_CACHE_MONGO else None)
@@ -0,0 +1,152 @@
+# rollups.py - daily rollup documents for the feedback and login trends
+import datetime
+import logging
+from pymongo import UpdateOne
+
+from database import user_logs_collection
+from database import feedback_collection
+from database import issues_collection
+from database import daily_stats_collection
+
+# One document per UTC day:
+# {_id: "YYYY-MM-DD", date, feedback_count, login_count, issue_count,
+#  issue_categories: {category: count}, time_taken_sum, time_taken_count}
+
+
+def _day(when):
+    return when.strftime("%Y-%m-%d")
+
+
+def _category_key(category):
+    # field names can't contain "." or start with "$"
+    return str(category).replace(".", "_").lstrip("$") or "_"
+
+
+def _increment(when, counters):
+    daily_stats_collection.update_one(
+        {"_id": _day(when)},
+        {"$inc": counters, "$setOnInsert": {"date": datetime.datetime(when.year, when.month, when.day)}},
+        upsert=True
+    )
+
+
+def record_feedback(when, time_taken, category=None):
+    counters = {"feedback_count": 1, "time_taken_sum": time_taken, "time_taken_count": 1}
+    if category is not None:
+        counters["issue_count"] = 1
+        counters[f"issue_categories.{_category_key(category)}"] = 1
+    try:
+        _increment(when, counters)
+    except Exception as e:
+        # the rollup can always be rebuilt with `python rollups.py backfill`
+        logging.error(f"Could not update daily rollup: {str(e)}")
+
+
+def record_login(when):
+    try:
+        _increment(when, {"login_count": 1})
+    except Exception as e:
+        logging.error(f"Could not update daily rollup: {str(e)}")
+
+
+def read_window(now, days):
+    """
+    Reads the rollups of the last `days` calendar days, today included.
+
+    Returns:
+        Dict of "YYYY-MM-DD" -> rollup document.
+    """
+    start_day = _day(now - datetime.timedelta(days=days - 1))
+    return {doc["_id"]: doc for doc in daily_stats_collection.find({"_id": {"$gte": start_day}})}
+
+
+def daily_counts(field, now, days, rollups=None):
+    """
+    Per-day counts of one rollup field for the last `days` days and their total.
+    """
+    rollups = read_window(now, days) if rollups is None else rollups
+
+    # Initialize counts for the last 'days' days
+    counts = {str((now - datetime.timedelta(days=i)).date()): 0 for i in range(days)}
+    for day, doc in rollups.items():
+        if day in counts:
+            counts[day] = doc.get(field, 0)
+    return counts, sum(counts.values())
+
+
+def _day_group(date_field, extra=None):
+    group = {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": f"${date_field}"}}, "count": {"$sum": 1}}
+    group.update(extra or {})
+    return group
+
+
+def backfill(start_date=None):
+    """
+    Rebuilds the rollups from the raw feedback, logs and issues collections
+    (from start_date onwards, or everything). Every day is overwritten with
+    its recomputed document rather than deleted first, so the dashboard
+    never sees an empty range and can run next to the app; only an
+    increment made while the aggregations run can be overwritten.
+
+    Returns:
+        Number of rollup documents written.
+    """
+    def match(date_field):
+        return [{"$match": {date_field: {"$gte": start_date}}}] if start_date else []
+
+    days = {}
+
+    def day_doc(day):
+        return days.setdefault(day, {
+            "date": datetime.datetime.strptime(day, "%Y-%m-%d"),
+            "feedback_count": 0, "login_count": 0, "issue_count": 0, "issue_categories": {},
+            "time_taken_sum": 0, "time_taken_count": 0
+        })
+
+    for row in feedback_collection.aggregate(match("date") + [{"$group": _day_group("date", {
+        "time_taken_sum": {"$sum": "$feedback_time_taken"},
+        "time_taken_count": {"$sum": {"$cond": [{"$isNumber": "$feedback_time_taken"}, 1, 0]}}
+    })}]):
+        doc = day_doc(row["_id"])
+        doc["feedback_count"] = row["count"]
+        doc["time_taken_sum"] = row["time_taken_sum"]
+        doc["time_taken_count"] = row["time_taken_count"]
+
+    for row in user_logs_collection.aggregate(match("date") + [{"$group": _day_group("date")}]):
+        day_doc(row["_id"])["login_count"] = row["count"]
+
+    for row in issues_collection.aggregate(match("issue_raise_date") + [{"$group": {
+        "_id": {
+            "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$issue_raise_date"}},
+            "category": "$category"
+        },
+        "count": {"$sum": 1}
+    }}]):
+        doc = day_doc(row["_id"]["day"])
+        doc["issue_count"] += row["count"]
+        key = _category_key(row["_id"].get("category"))
+        doc["issue_categories"][key] = doc["issue_categories"].get(key, 0) + row["count"]
+
+    # days that have a rollup but no raw data anymore are reset to zero
+    for day in daily_stats_collection.distinct("_id", {"_id": {"$gte": _day(start_date)}} if start_date else {}):
+        day_doc(day)
+
+    operations = [UpdateOne({"_id": day}, {"$set": doc}, upsert=True) for day, doc in days.items() if day]
+    for i in range(0, len(operations), 1000):
+        daily_stats_collection.bulk_write(operations[i:i + 1000], ordered=False)
+    return len(operations)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Daily rollups for the feedback and login trends")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--days", type=int, help="only rebuild the last N days")
+    args = parser.parse_args()
+
+    start = None
+    if args.days:
+        today = datetime.datetime.utcnow()
+        start = datetime.datetime(today.year, today.month, today.day) - datetime.timedelta(days=args.days)
+    print(f"Wrote {backfill(start)} daily rollups")
@@ -0,0 +1,310 @@
+# scoring.py - per-card trust score index built from the lending history
+import threading
+
+import lendstore
+from startup import lazy_import
+
+# imported on first use, so workers that never score don't load them
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+RECENT_DAYS = 15
+
+# Weighted average of the normalized scores
+WEIGHTS = {
+    'activity': 0.10,  # Recent usage
+    'engagement': 0.50, # Historical usage
+    'responsibility': 0.20, # Return behavior
+    'financial': 0.10, # Fine payments
+    'recency': 0.10     # Account activity
+}
+
+_index = None
+_index_source = None  # (manifest state, base, applied segments) the index was built from
+_lock = threading.Lock()
+
+
+class CardIndex:
+    """
+    Per-card aggregates of the lending history.
+
+    - 'Check in' = Lending (user takes book)
+    - 'Check out' = Returning (user brings book back)
+    - Negative 'Amount' = Fine payment (e.g., -40.00 = ₹40 fine)
+
+    `stats` is a DataFrame indexed by card number with total_lends, returns,
+    fine_sum, fine_count, mean_fine and last_activity columns. `lend_times`
+    holds the lend timestamps (int64 nanoseconds) of the first cards in
+    `stats` order, sorted within each card; the lends of the i-th card are
+    lend_times[lend_offsets[i]:lend_offsets[i + 1]], so recent lends can be
+    counted with a binary search. Lends of ingested batches are kept per card
+    in `extra_lends` (see with_batch).
+    """
+
+    def __init__(self, stats, lend_offsets, lend_times, extra_lends=None):
+        self.stats = stats
+        self.lend_offsets = lend_offsets
+        self.lend_times = lend_times
+        self.extra_lends = extra_lends or {}
+        self._positions = {card: i for i, card in enumerate(stats.index)}
+        self._records = dict(zip(
+            stats.index,
+            zip(stats['total_lends'].to_numpy(),
+                stats['returns'].to_numpy(),
+                stats['mean_fine'].to_numpy(),
+                stats['last_activity'].to_numpy())
+        ))
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, card):
+        return card in self._records
+
+    def get(self, card):
+        return self._records.get(card)
+
+    def recent_lends(self, card, since):
+        i = self._positions.get(card)
+        if i is None:
+            return 0
+        since = pd.Timestamp(since).value
+        count = 0
+        if i < len(self.lend_offsets) - 1:
+            times = self.lend_times[self.lend_offsets[i]:self.lend_offsets[i + 1]]
+            count = len(times) - int(np.searchsorted(times, since, side='left'))
+        extra = self.extra_lends.get(card)
+        if extra is not None:
+            count += len(extra) - int(np.searchsorted(extra, since, side='left'))
+        return count
+
+    def recent_lend_counts(self, since):
+        # lends since `since` of every card, in `stats` order
+        since = pd.Timestamp(since).value
+        counts = np.zeros(len(self.stats), dtype=np.int64)
+        base = _segment_sums(self.lend_times >= since, self.lend_offsets)
+        counts[:len(base)] = base
+        for card, extra in self.extra_lends.items():
+            counts[self._positions[card]] += len(extra) - int(np.searchsorted(extra, since, side='left'))
+        return counts
+
+    def with_batch(self, batch_store):
+        """
+        Returns a new index with the transactions of batch_store added. Only the
+        cards in the batch are re-aggregated; the base arrays are shared.
+        """
+        batch = build_index_from_store(batch_store)
+        added = batch.stats
+        stats = self.stats.reindex(self.stats.index.append(added.index.difference(self.stats.index)))
+        affected = added.index
+
+        old = stats.loc[affected]
+        for column in ('total_lends', 'returns', 'fine_count'):
+            stats.loc[affected, column] = old[column].fillna(0).to_numpy() + added[column].to_numpy()
+        stats.loc[affected, 'fine_sum'] = old['fine_sum'].fillna(0).to_numpy() + added['fine_sum'].to_numpy()
+        stats.loc[affected, 'last_activity'] = np.maximum(
+            old['last_activity'].fillna(pd.Timestamp.min).to_numpy(), added['last_activity'].to_numpy())
+        stats = stats.astype({'total_lends': 'int64', 'returns': 'int64', 'fine_count': 'int64'})
+        stats['mean_fine'] = _mean_fine(stats['fine_sum'].to_numpy(), stats['fine_count'].to_numpy())
+
+        extra_lends = dict(self.extra_lends)
+        for i, card in enumerate(added.index):
+            lends = batch.lend_times[batch.lend_offsets[i]:batch.lend_offsets[i + 1]]
+            if len(lends):
+                extra_lends[card] = np.sort(np.concatenate([extra_lends.get(card, lends[:0]), lends]))
+        return CardIndex(stats, self.lend_offsets, self.lend_times, extra_lends)
+
+
+def _segment_sums(values, offsets):
+    # sum of values[offsets[i]:offsets[i + 1]] for every i (empty segments give 0)
+    totals = np.concatenate(([0], np.cumsum(values)))
+    return totals[offsets[1:]] - totals[offsets[:-1]]
+
+
+def build_index_from_store(store):
+    """
+    Aggregates a lendstore.LendStore (rows sorted by card, then time) per card.
+    """
+    offsets = np.asarray(store.card_offsets)
+    transaction_codes = store.transaction_codes
+    amounts = store.amounts
+
+    payment = (transaction_codes == store.transaction_code(lendstore.PAYMENT)) & ~np.isnan(amounts)
+    fine_count = _segment_sums(payment, offsets)
+    fine_sum = _segment_float_sums(np.asarray(amounts)[payment], fine_count)
+
+    has_rows = offsets[1:] > offsets[:-1]
+    last_rows = np.maximum(offsets[1:] - 1, 0)
+    stats = pd.DataFrame({
+        'total_lends': _segment_sums(transaction_codes == store.transaction_code(lendstore.LEND), offsets),
+        'returns': _segment_sums(transaction_codes == store.transaction_code(lendstore.RETURN), offsets),
+        'fine_sum': fine_sum,
+        'fine_count': fine_count,
+        'mean_fine': _mean_fine(fine_sum, fine_count),  # NaN when the card never paid a fine
+        'last_activity': pd.to_datetime(np.asarray(store.timestamps)[last_rows]),
+    }, index=pd.Index(store.cards, name='card'))
+
+    # cards without any rows only exist in the dictionary, leave them out
+    if not has_rows.all():
+        return CardIndex(stats[has_rows], _compact_offsets(store.lend_offsets, has_rows),
+                         store.lend_times)
+    return CardIndex(stats, np.asarray(store.lend_offsets), store.lend_times)
+
+
+def _segment_float_sums(values, counts):
+    """
+    Sums consecutive segments of the given lengths exactly like np.sum on
+    each segment (and so a pandas Series.mean). Differences of a
+    running total lose the low digits on long histories and can move a
+    score across a rounding boundary.
+    """
+    counts = np.asarray(counts)
+    offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+    sums = np.zeros(len(counts))
+    # np.sum adds fewer than 8 values one after the other: do that for all
+    # segments at once, a column at a time, and sum the longer ones singly
+    short = np.flatnonzero((counts > 0) & (counts < 8))
+    for j in range(int(counts[short].max()) if len(short) else 0):
+        rows = short[counts[short] > j]
+        sums[rows] += values[offsets[rows] + j]
+    for i in np.flatnonzero(counts >= 8):
+        sums[i] = np.sum(values[offsets[i]:offsets[i + 1]])
+    return sums
+
+
+def _mean_fine(fine_sum, fine_count):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.abs(np.where(fine_count > 0, fine_sum / np.maximum(fine_count, 1), np.nan))
+
+
+def _compact_offsets(offsets, keep):
+    # offsets of the kept segments only; dropped segments are empty so the lend_times don't move
+    offsets = np.asarray(offsets)
+    return np.concatenate(([offsets[0]], offsets[1:][keep]))
+
+
+def build_card_index(df):
+    """
+    Parses the dates once and groups a lending history DataFrame by card number.
+    """
+    return build_index_from_store(lendstore.from_frame(df))
+
+
+def get_card_index():
+    """
+    Returns the index of the lending history, building it on first use from
+    the memory-mapped lend store (or the CSV when it hasn't been converted).
+    Batches ingested into the store since then are applied incrementally.
+    """
+    global _index, _index_source
+    state = lendstore.manifest_state()
+    if _index is not None and (_index_source[0] if _index_source else None) == state:
+        return _index
+
+    with _lock:
+        if _index is None or (_index_source[0] if _index_source else None) != state:
+            if state is None:
+                _index, _index_source = build_index_from_store(lendstore.load_store()), None
+            else:
+                _index, _index_source = _refresh_index(_index, _index_source, state)
+    return _index
+
+
+def _refresh_index(index, source, state):
+    manifest = lendstore.read_manifest()
+    segments = manifest["segments"]
+
+    if index is None or source is None or source[1] != manifest["base"] or segments[:len(source[2])] != source[2]:
+        # first load, or the store was converted/compacted: start from the new base
+        index = build_index_from_store(lendstore.open_store(manifest=manifest))
+        new_segments = segments
+    else:
+        new_segments = segments[len(source[2]):]
+
+    if new_segments:
+        index = index.with_batch(lendstore.concat_stores(lendstore.open_segments(new_segments)))
+    # the new index replaces the old one in a single assignment
+    return index, (state, manifest["base"], segments)
+
+
+def normalize_scores(recent_lends, total_lends, returns, mean_fine, days_inactive):
+    """
+    Normalizes the raw metrics into 0-1 scores. Works on scalars as well as
+    numpy arrays / pandas Series of metrics for many cards at once.
+    """
+    total_lends = np.asarray(total_lends, dtype='float64')
+    mean_fine = np.asarray(mean_fine, dtype='float64')
+    return {
+        'activity': np.minimum(np.asarray(recent_lends) / 4, 1.0),  # 4+ recent lends = 1.0
+        'engagement': np.minimum(total_lends / 10, 1.0), # 10+ total lends = 1.0
+        'responsibility': np.where(total_lends > 0, np.asarray(returns) / np.maximum(total_lends, 1), 0.0),
+        # ₹200 = 0 score; cards without any fine payment score 0 here, as they always have
+        'financial': np.where(np.isnan(mean_fine), 0.0, np.maximum(0, 1 - mean_fine / 200)),
+        'recency': np.exp(-0.05 * np.asarray(days_inactive, dtype='float64')) # 5% daily decay
+    }
+
+
+def weighted_score(scores):
+    return sum(scores[k] * WEIGHTS[k] for k in WEIGHTS)
+
+
+def priority_tier(final_score):
+    # Priority tiers
+    if final_score >= 0.7:
+        return 'high'
+    elif final_score >= 0.4:
+        return 'medium'
+    else:
+        return 'low'
+
+
+def score_card(index, card, now=None):
+    """
+    Scores a single card from the index. Only the time-relative parts
+    (recent lends and the recency decay) are computed here.
+
+    Returns:
+        Tuple[float, str]: Trust score (0-1) and priority tier.
+    """
+    record = index.get(card)
+    if record is None:
+        return 0.0, 'low'
+    total_lends, returns, mean_fine, last_activity = record
+
+    today = now or pd.Timestamp.now()
+    recent_lends = index.recent_lends(card, today - pd.Timedelta(days=RECENT_DAYS))
+    days_inactive = (today - pd.Timestamp(last_activity)).days
+
+    scores = normalize_scores(recent_lends, total_lends, returns, mean_fine, days_inactive)
+    final_score = float(weighted_score(scores))
+    return round(final_score, 2), priority_tier(final_score)
+
+
+def score_all(index, now=None):
+    """
+    Scores every card in the index in one vectorized pass.
+
+    Returns:
+        DataFrame indexed by card number with the five normalized scores,
+        the final score and the priority tier.
+    """
+    today = now or pd.Timestamp.now()
+    stats = index.stats
+
+    recent_lends = index.recent_lend_counts(today - pd.Timedelta(days=RECENT_DAYS))
+    days_inactive = (today - stats['last_activity']).dt.days
+
+    scores = normalize_scores(recent_lends, stats['total_lends'].to_numpy(),
+                              stats['returns'].to_numpy(), stats['mean_fine'].to_numpy(),
+                              days_inactive.to_numpy())
+    final_score = weighted_score(scores)
+
+    result = pd.DataFrame(scores, index=stats.index)
+    result['score'] = np.round(final_score, 2)
+    result['priority'] = np.select([final_score >= 0.7, final_score >= 0.4], ['high', 'medium'], 'low')
+
+    # Auto-accept faculty (cards starting with 'C')
+    faculty = result.index.str.startswith('C')
+    result.loc[faculty, 'score'] = 1.0
+    result.loc[faculty, 'priority'] = 'high'
+    return result
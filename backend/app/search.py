@@ -0,0 +1,65 @@
+# search.py - index-friendly filters for the admin search routes
+import re
+from pymongo import DESCENDING
+
+from exports import parse_date_range
+
+
+def prefix_filter(query):
+    """
+    Anchored, case-sensitive prefix match on a lower-cased value, which Mongo
+    can answer with an index range scan (unlike an unanchored or /i regex).
+    """
+    return {"$regex": "^" + re.escape(query.strip().lower())}
+
+
+def text_search(query):
+    """
+    Returns the filter, projection and sort for a relevance ranked $text search.
+    """
+    return (
+        {"$text": {"$search": query}},
+        {"score": {"$meta": "textScore"}},
+        [("score", {"$meta": "textScore"})]
+    )
+
+
+def feedback_search(filter_type, query="", start_date=None, end_date=None):
+    """
+    Builds (filters, projection, sort) for /admin/search_feedback.
+    Raises ValueError on an unknown filter type or malformed dates.
+    """
+    filters, projection, sort = {}, {}, [("date", DESCENDING)]
+    if filter_type == "roll_no":
+        if query:
+            filters["roll_no"] = prefix_filter(query)
+    elif filter_type == "keyword":
+        if query:
+            filters, projection, sort = text_search(query)
+    else:
+        raise ValueError("Invalid filter type.")
+
+    date_range = parse_date_range(start_date, end_date)
+    if date_range:
+        filters["date"] = date_range
+    return filters, projection, sort
+
+
+def issue_search(status=None, category=None, query="", filter_type="user"):
+    """
+    Builds (filters, projection, sort) for /admin/filter_issues. A "user" query
+    is a roll number / email prefix of the reporter, a "keyword" query is
+    searched in the issue text.
+    """
+    filters, projection, sort = {}, {}, [("issue_raise_date", DESCENDING)]
+    if query:
+        if filter_type == "keyword":
+            filters, projection, sort = text_search(query)
+        else:
+            # issues only store the reporter's email, which starts with the roll number
+            filters["raised_by"] = prefix_filter(query)
+    if status:
+        filters["status"] = status
+    if category:
+        filters["category"] = category
+    return filters, projection, sort
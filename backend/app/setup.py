@@ -1,8 +1,13 @@
 # setup.py
 import os
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+import argparse
+
+MODEL_DIR = "local_model"
+
 
 def setup_model():
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
     model_name = "distilbert-base-uncased-finetuned-sst-2-english"
     print("Downloading model and tokenizer...")
     
@@ -11,11 +16,65 @@ def setup_model():
     model = AutoModelForSequenceClassification.from_pretrained(model_name)
 
     # Save to local directory
-    os.makedirs("local_model", exist_ok=True)
-    tokenizer.save_pretrained("local_model")
-    model.save_pretrained("local_model")
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    tokenizer.save_pretrained(MODEL_DIR)
+    model.save_pretrained(MODEL_DIR)
     
     print("Model and tokenizer are saved locally in './local_model'")
 
+
+def export_onnx(model_dir=MODEL_DIR, quantize=True):
+    """
+    Exports the saved model to model_dir/model.onnx for the onnx backend and,
+    with quantize, a dynamically int8 quantized model-int8.onnx for onnx-int8
+    (see CLASSIFIER_BACKEND in classifier.py). Needs torch, onnx and onnxruntime.
+    """
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+    model.eval()
+    model.config.return_dict = False
+
+    onnx_path = os.path.join(model_dir, "model.onnx")
+    sample = tokenizer(["The library is good", "The Wi-Fi is slow"], padding=True, return_tensors="pt")
+    dynamic_axes = {"batch": 0, "sequence": 1}
+    torch.onnx.export(
+        model,
+        (sample["input_ids"], sample["attention_mask"]),
+        onnx_path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={"input_ids": dynamic_axes, "attention_mask": dynamic_axes, "logits": {0: "batch"}},
+        opset_version=14
+    )
+    print(f"ONNX model saved to {onnx_path}")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        int8_path = os.path.join(model_dir, "model-int8.onnx")
+        quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"Quantized int8 model saved to {int8_path}")
+    print("Run `python classifier.py parity` to check the labels against the torch model")
+
+
 if __name__ == "__main__":
-    setup_model()
+    parser = argparse.ArgumentParser(description="Download the sentiment model")
+    parser.add_argument("--onnx", action="store_true", help="also export it to ONNX for onnxruntime")
+    parser.add_argument("--no-quantize", action="store_true", help="skip the int8 quantized ONNX model")
+    parser.add_argument("--shared-weights", action="store_true",
+                        help="also write local_model/weights.bin, which all workers map instead of loading a copy")
+    parser.add_argument("--skip-download", action="store_true", help="export the model already in ./local_model")
+    args = parser.parse_args()
+
+    if not args.skip_download:
+        setup_model()
+    if args.onnx:
+        export_onnx(quantize=not args.no_quantize)
+    if args.shared_weights:
+        import classifier
+
+        size = classifier.export_shared_weights(MODEL_DIR)
+        print(f"Shared weights ({size / 2 ** 20:.0f} MB) saved to {os.path.join(MODEL_DIR, classifier.SHARED_WEIGHTS_FILE)}")
@@ -0,0 +1,121 @@
+# startup.py - lazy imports of the heavy dependencies and a startup time report
+import sys
+import time
+import importlib
+import importlib.abc
+from contextlib import contextmanager
+
+# Dependencies that must not be imported while the app boots
+HEAVY_MODULES = ("numpy", "pandas", "torch", "transformers")
+
+_import_times = []  # (module name, nesting depth, seconds)
+_init_times = []  # (initializer name, seconds)
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is only imported on first attribute access:
+
+        np = lazy_import("numpy")   # nothing imported yet
+        np.zeros(3)                 # numpy is imported here
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
+
+
+def loaded_heavy_modules():
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+@contextmanager
+def timed(name):
+    # times one startup initializer (index creation, model warm up, ...)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _init_times.append((name, time.perf_counter() - start))
+
+
+class _TimingLoader(importlib.abc.Loader):
+    def __init__(self, loader, depth):
+        self.loader = loader
+        self.depth = depth
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        # reserve the slot first so the report lists imports in the order they started
+        slot = len(_import_times)
+        _import_times.append((module.__name__, self.depth, 0.0))
+        _ImportTimer.depth += 1
+        start = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            _ImportTimer.depth -= 1
+            _import_times[slot] = (module.__name__, self.depth, time.perf_counter() - start)
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    depth = 0
+
+    def find_spec(self, name, path, target=None):
+        # let the regular finders locate the module, then wrap its loader
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimingLoader(spec.loader, _ImportTimer.depth)
+                return spec
+        return None
+
+
+def install_import_timer():
+    """
+    Records how long every module import takes from now on. Only used for
+    the startup report, since it puts itself in front of every import.
+    """
+    if not any(isinstance(finder, _ImportTimer) for finder in sys.meta_path):
+        sys.meta_path.insert(0, _ImportTimer())
+
+
+def report(total=None, max_depth=1, min_seconds=0.001):
+    """
+    Formats the recorded import and initializer timings. Imports are
+    inclusive of the modules they import in turn; nested imports are shown
+    down to max_depth.
+    """
+    lines = ["Imports:"]
+    for name, depth, seconds in _import_times:
+        if depth <= max_depth and seconds >= min_seconds:
+            lines.append(f"  {seconds * 1000:9.1f} ms  {'  ' * depth}{name}")
+    lines.append("Initializers:")
+    for name, seconds in _init_times:
+        lines.append(f"  {seconds * 1000:9.1f} ms  {name}")
+    if total is not None:
+        lines.append(f"Total: {total * 1000:.1f} ms")
+    heavy = loaded_heavy_modules()
+    lines.append(f"Heavy modules loaded: {', '.join(heavy) if heavy else 'none'}")
+    return "\n".join(lines)
@@ -1,19 +1,20 @@
 from flask import Blueprint, request, jsonify
 from flask_cors import CORS
 from datetime import datetime
-import pipeline
+import jobs
+import rollups
+import metrics
+import questions
 from bson import ObjectId
 
 # importing database collections from app
 from database import users_collection
 from database import user_logs_collection
-from database import questions_collection
-from database import feedback_collection
-from database import issues_collection
 
 # Flask Blueprint
 users_bp = Blueprint("users", __name__)
 CORS(users_bp)
+metrics.instrument(users_bp)
 
 session = {}
 
@@ -59,6 +60,7 @@ def login():
     try:
         log_entry = {"roll_no": uid, "date": datetime.utcnow()}
         user_logs_collection.insert_one(log_entry)
+        rollups.record_login(log_entry["date"])
     except Exception as e:
         print(f"[-] Error: {e} : {uid} : in user/login/logs section")
 
@@ -78,19 +80,8 @@ def check_session():
 
 @users_bp.route("/get_feedback_questions", methods=["GET"])
 def get_feedback_questions():
-    questions = questions_collection.find({}, {"_id": 1, "question": 1, "options": 1})
-    feedback_questions = []
-    for question in questions:
-        if "question" in question and "options" in question:
-            feedback_questions.append({
-                "id": str(question["_id"]),
-                "question": question["question"],
-                "options": question["options"]
-            })
-        else:
-            print(f"Missing keys in question document: {question}")
-
-    return jsonify(feedback_questions), 200
+    # served from the per-process question cache, 304 when the browser's copy is current
+    return questions.questions_response(request)
 
 @users_bp.route("/submit_feedback", methods=["POST"])
 def submit_feedback():
@@ -102,19 +93,10 @@ def submit_feedback():
     feedback_data = request.json.get("feedback")
     start_time = request.json.get("start_time")  # This should be a timestamp
 
-    print(feedback_data)
-    print("Last question and answer: ",feedback_data[-1]['answer'])
-
-    if uid[0].isdigit():
-        user_score, priority = pipeline.calculate_feedback_score(uid.upper())
-    else:
-        # it should check the staff ID with the email address
-        # as of now for staff we can give score as 1.0
-        user_score, priority = 1.0, 'high'
-    label, confidence = pipeline.classify_feedback(feedback_data[-1]['answer'])
-
-    # TODO: classify the issue
-
+    if not isinstance(feedback_data, list) or not feedback_data or "answer" not in feedback_data[-1]:
+        return jsonify({"error": "Feedback answers are required"}), 400
+    if not isinstance(start_time, (int, float)):
+        return jsonify({"error": "start_time must be a timestamp in seconds"}), 400
 
     # Convert start_time from seconds to a datetime object
     start_time = datetime.utcfromtimestamp(start_time)
@@ -123,55 +105,31 @@ def submit_feedback():
     submission_time = datetime.utcnow()
     time_taken = (submission_time - start_time).total_seconds()
 
+    # scoring, classification, the issue, the thank you mail and the rollups
+    # run in the background (see jobs.py); the student only waits for this insert
+    feedback_id = jobs.submit(email, uid, feedback_data, submission_time, time_taken)
+
+    return jsonify({
+        "message": "Feedback submitted successfully",
+        "feedback_id": str(feedback_id),
+        "status": "PROCESSING",
+        "time_taken": time_taken
+    }), 202
+
+
+# route to poll the progress of a submission
+@users_bp.route("/feedback_status/<feedback_id>", methods=["GET"])
+def feedback_status(feedback_id):
+    if "email" not in session:
+        return jsonify({"error": "Unauthorized"}), 403
+    if not ObjectId.is_valid(feedback_id):
+        return jsonify({"error": "Invalid feedback id"}), 400
+
+    status = jobs.job_status(ObjectId(feedback_id), session["email"])
+    if status is None:
+        return jsonify({"error": "Feedback not found"}), 404
+    return jsonify(status), 200
 
-    issue_presence = False
-    if label == 'ISSUE':
-        issue_presence = True
-        category = pipeline.classify_issues(feedback_data[-1]['answer'])
-        issue_entry = {
-            "_id": ObjectId(),  # Automatically generate a unique ObjectId
-            "raised_by": email,
-            "issue_raise_date": submission_time,
-            "user_score": user_score,
-            "issue": feedback_data[-1]['answer'],
-            "status": "PENDING",
-            "category":category,
-            "resolved_date": ""
-        }
-        issues_collection.insert_one(issue_entry)
-
-        # TODO: send a mail when an issue is raised
-
-
-    # Insert feedback into the feedback collection
-    feedback_entry = {
-        "_id":ObjectId(),
-        "email": email,
-        "roll_no": uid,
-        "feedback_answers": feedback_data,
-        "date": submission_time,
-        "feedback_time_taken": time_taken,
-        "floor_no":3,
-        "issue_presence":issue_presence
-    }
-
-    feedback_collection.insert_one(feedback_entry)
-    # send thank you mail
-    pipeline.send_tks_mail(email,uid)
-
-    # Update user collection with last feedback time
-    users_collection.update_one(
-        {"email": email},
-        {"$set": {
-            "last_feedback": submission_time
-        }}
-    )
-
-    return jsonify({"message": "Feedback submitted successfully", "time_taken": time_taken}), 200
-    
-
-
-# TODO: create some loading or submission in process page while feedback submission
 
 
 
@@ -0,0 +1,16 @@
+# wsgi.py - production entry point: gunicorn -c gunicorn.conf.py wsgi:app (or waitress-serve wsgi:app)
+import os
+from app import create_app, preload_shared_resources, start_background_workers
+
+# gunicorn.conf.py sets this before it imports the app in the master
+PRELOADED_BY_GUNICORN = os.getenv("GUNICORN_PRELOAD_APP") == "true"
+
+# With gunicorn's preload_app this runs once in the master: the read-only
+# resources are loaded before the workers are forked and shared between them.
+# Background workers and the Mongo client are started per worker after fork.
+# Any other server (waitress, gunicorn without the config) serves from the
+# process that imported this module, so the background workers start here.
+preload_shared_resources()
+app = create_app(start_workers=False)
+if not PRELOADED_BY_GUNICORN:
+    start_background_workers()
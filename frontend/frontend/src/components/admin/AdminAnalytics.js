@@ -45,28 +45,20 @@ function AdminAnalytics() {
       }
     };
 
-    const fetchIssueCounts = async () => {
+    // Issue counts and categories come from the cached dashboard endpoint
+    const fetchIssueSummary = async () => {
       try {
-        const response = await axios.get('http://localhost:5000/admin/get_issue_counts');
-        setIssueCounts(response.data);
+        const response = await axios.get('http://localhost:5000/admin/dashboard');
+        setIssueCounts(response.data.issue_counts);
+        setCategoryData(response.data.issue_categories);
+        setCategories(Object.keys(response.data.issue_categories)); // Set categories for the filter
       } catch (error) {
-        console.error('Error fetching issue counts:', error);
-      }
-    };
-
-    const fetchCategoryData = async () => {
-      try {
-        const response = await axios.get('http://localhost:5000/admin/get_issue_categories');
-        setCategoryData(response.data);
-        setCategories(Object.keys(response.data)); // Set categories for the filter
-      } catch (error) {
-        console.error('Error fetching category data:', error);
+        console.error('Error fetching issue summary:', error);
       }
     };
 
     fetchIssues();
-    fetchIssueCounts();
-    fetchCategoryData();
+    fetchIssueSummary();
   }, []);
 
   const handleFilterChange = async () => {
@@ -13,6 +13,8 @@ function AdminFeedbackView() {
   const [startDate, setStartDate] = useState(''); // State for start date
   const [endDate, setEndDate] = useState(''); // State for end date
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null); // Cursor of the next page of submissions
+  const [totalCount, setTotalCount] = useState(0);
 
   useEffect(() => {
     const checkSession = async () => {
@@ -31,18 +33,24 @@ function AdminFeedbackView() {
     checkSession();
   }, [navigate]);
 
-  useEffect(() => {
-    const fetchFeedbacks = async () => {
-      try {
-        const response = await axios.get('http://localhost:5000/admin/get_feedback_submissions');
-        setFeedbacks(response.data);
-        setFilteredFeedbacks(response.data); // Initialize filtered feedbacks
-      } catch (error) {
-        console.error('Error fetching feedback submissions:', error);
-      }
-    };
+  const fetchFeedbacks = async (cursor = null) => {
+    try {
+      const response = await axios.get('http://localhost:5000/admin/get_feedback_submissions', {
+        params: cursor ? { cursor } : {},
+      });
+      const loaded = cursor ? [...feedbacks, ...response.data] : response.data;
+      setFeedbacks(loaded);
+      setFilteredFeedbacks(loaded); // Initialize filtered feedbacks
+      setNextCursor(response.headers['x-next-cursor'] || null);
+      setTotalCount(Number(response.headers['x-total-count'] || loaded.length));
+    } catch (error) {
+      console.error('Error fetching feedback submissions:', error);
+    }
+  };
 
+  useEffect(() => {
     fetchFeedbacks();
+    // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []);
 
   const handleSearch = async () => {
@@ -153,6 +161,11 @@ function AdminFeedbackView() {
           </tbody>
         </table>
       )}
+      {nextCursor && filteredFeedbacks === feedbacks && (
+        <button onClick={() => fetchFeedbacks(nextCursor)} style={styles.button}>
+          Load more ({feedbacks.length} of {totalCount})
+        </button>
+      )}
     </div>
   );
 }
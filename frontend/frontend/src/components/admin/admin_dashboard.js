@@ -36,49 +36,22 @@ function AdminDashboard() {
     checkSession();
   }, [navigate]);
 
-  const fetchCounts = async (days) => {
+  // All dashboard figures come from one cached endpoint
+  const fetchDashboard = async (days) => {
     try {
-      const feedbackResponse = await axios.get(`http://localhost:5000/admin/feedback_count?days=${days}`);
-      const loginResponse = await axios.get(`http://localhost:5000/admin/login_count?days=${days}`);
-      setFeedbackData(Object.values(feedbackResponse.data));
-      setLoginData(Object.values(loginResponse.data));
+      const response = await axios.get(`http://localhost:5000/admin/dashboard?days=${days}`);
+      setFeedbackData(Object.values(response.data.feedback_count));
+      setLoginData(Object.values(response.data.login_count));
+      setFeedbackRate(response.data.feedback_rate);
+      setLoginRate(response.data.login_rate);
+      setTimeTakenData(response.data.feedback_time_taken);
     } catch (err) {
-      console.error('Failed to fetch counts:', err);
-    }
-  };
-
-  const fetchFeedbackRate = async (days) => {
-    try {
-      const response = await axios.get(`http://localhost:5000/admin/feedback_rate/${days}`);
-      setFeedbackRate(response.data.rate);
-    } catch (err) {
-      console.error('Failed to fetch feedback rate:', err);
-    }
-  };
-
-  const fetchLoginRate = async (days) => {
-    try {
-      const response = await axios.get(`http://localhost:5000/admin/login_rate/${days}`);
-      setLoginRate(response.data.rate);
-    } catch (err) {
-      console.error('Failed to fetch login rate:', err);
-    }
-  };
-
-  const fetchTimeTaken = async () => {
-    try {
-      const response = await axios.get(`http://localhost:5000/admin/feedback_time_taken`);
-      setTimeTakenData(response.data);
-    } catch (err) {
-      console.error('Failed to fetch time taken data:', err);
+      console.error('Failed to fetch dashboard data:', err);
     }
   };
 
   useEffect(() => {
-    fetchCounts(days);
-    fetchFeedbackRate(days); // Fetch feedback rate for the new number of days
-    fetchLoginRate(days); // Fetch login rate for the new number of days
-    fetchTimeTaken(); // Fetch time taken data
+    fetchDashboard(days);
   }, [days]); // Dependency array includes days
 
   const handleDaysChange = (e) => {
@@ -88,10 +61,6 @@ function AdminDashboard() {
       setWarning('Please enter a number of days greater than or equal to 5.');
     } else {
       setWarning('');
-      fetchCounts(value); // Fetch new data based on the new number of days
-      fetchFeedbackRate(value); // Fetch feedback rate for the new number of days
-      fetchLoginRate(value); // Fetch login rate for the new number of days
-      fetchTimeTaken(); // Fetch time taken data
     }
   };
 
@@ -1,6 +1,10 @@
 import React, { useEffect, useState } from 'react';
 import axios from 'axios';
 
+// the submission is processed in the background; its status is polled until it leaves PROCESSING
+const STATUS_POLL_MS = 1000;
+const STATUS_POLL_LIMIT = 30;
+
 function LibraryFeedbackForm() {
   const [questions, setQuestions] = useState([]);
   const [answers, setAnswers] = useState({});
@@ -8,6 +12,7 @@ function LibraryFeedbackForm() {
   const [startTime, setStartTime] = useState(null);
   const [loading, setLoading] = useState(true);
   const [submitting, setSubmitting] = useState(false);
+  const [processing, setProcessing] = useState(false);
 
   useEffect(() => {
     const fetchQuestions = async () => {
@@ -47,18 +52,37 @@ function LibraryFeedbackForm() {
     const startTimeInSeconds = Math.floor(startTime.getTime() / 1000);
 
     try {
-      await axios.post('http://localhost:5000/users/submit_feedback', {
+      const response = await axios.post('http://localhost:5000/users/submit_feedback', {
         feedback: feedbackData,
         start_time: startTimeInSeconds,
       });
-      alert('Feedback submitted successfully!');
+      setProcessing(true);
+      const status = await waitForProcessing(response.data.feedback_id);
+      if (status === 'FAILED') {
+        alert('Your feedback was saved, but it could not be processed yet.');
+      } else {
+        alert('Feedback submitted successfully!');
+      }
     } catch (error) {
       console.error('Error submitting feedback:', error);
     } finally {
+      setProcessing(false);
       setSubmitting(false);
     }
   };
 
+  const waitForProcessing = async (feedbackId) => {
+    for (let i = 0; i < STATUS_POLL_LIMIT; i++) {
+      const response = await axios.get(`http://localhost:5000/users/feedback_status/${feedbackId}`);
+      if (response.data.status !== 'PROCESSING') {
+        return response.data.status;
+      }
+      await new Promise((resolve) => setTimeout(resolve, STATUS_POLL_MS));
+    }
+    // still processing: it is stored and the workers will finish it, no need to keep the student waiting
+    return 'PROCESSING';
+  };
+
   if (loading) {
     return <div>Loading...</div>;
   }
@@ -113,7 +137,9 @@ function LibraryFeedbackForm() {
           <div style={styles.modalContent}>
             <h3 style={{ marginBottom: '15px' }}>Thank you for your feedback!</h3>
             <div style={styles.spinner}></div>
-            <h3 style={{ marginBottom: '15px' }}>Please wait...<br />It may take few seconds...</h3>
+            <h3 style={{ marginBottom: '15px' }}>
+              {processing ? 'Processing your feedback...' : 'Please wait...'}<br />It may take few seconds...
+            </h3>
           </div>
         </div>
       )}